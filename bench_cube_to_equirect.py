@@ -0,0 +1,213 @@
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import py360convert
+
+import cube_backends
+import cube_faces
+from pano_metrics import library_versions, machine_info, peak_rss_mb
+
+
+DEFAULT_FACE_SIZES = (1024, 2048, 4096, 8192)
+DEFAULT_WIDTHS = (4096, 8192)
+
+
+def make_synthetic_faces(face_dir, face_size):
+    """
+    Write Bench1.jpg .. Bench6.jpg with a deterministic textured pattern
+    (gradients plus noise, so JPEG decode cost is realistic).
+    Existing faces of the right size are reused.
+    """
+
+    os.makedirs(face_dir, exist_ok=True)
+    faces = {i: f"Bench{i}.jpg" for i in range(1, 7)}
+    if all(os.path.isfile(os.path.join(face_dir, name)) for name in faces.values()):
+        return faces
+
+    rng = np.random.default_rng(face_size)
+    ramp = np.linspace(0, 255, face_size, dtype=np.float32)
+    for idx, name in faces.items():
+        img = np.empty((face_size, face_size, 3), dtype=np.uint8)
+        noise = rng.integers(0, 48, (face_size, face_size), dtype=np.uint8)
+        img[..., 0] = (ramp[None, :] * 0.8).astype(np.uint8) + noise
+        img[..., 1] = (ramp[:, None] * 0.8).astype(np.uint8) + noise
+        img[..., 2] = idx * 36
+        cv2.imwrite(os.path.join(face_dir, name), img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return faces
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run_case(face_dir, faces, face_size, width, repeat, out_dir, backends=()):
+    """
+    Benchmark one (face_size, width) pair. Runs in a fresh process so
+    that the peak RSS numbers belong to this case only.
+
+    Each of backends is also timed cold (tables built) and warm; peak RSS
+    only grows, so their memory is the tracemalloc peak of the cold run.
+    """
+
+    stages = {}
+    rss = {"start": peak_rss_mb()}
+    traced = {}
+
+    def record(stage, seconds):
+        stages.setdefault(stage, []).append(seconds)
+        rss[stage] = peak_rss_mb()
+
+    out_path = os.path.join(out_dir, f"bench_{face_size}_{width}.jpg")
+    for _ in range(repeat):
+        # decode only; the downscale is timed on its own below
+        cube, t = timed(cube_faces.load_cube_faces, face_dir, faces, 10 ** 9)
+        record("load_cube_faces", t)
+
+        cube, t = timed(cube_faces.maybe_downscale_cube_faces, cube)
+        record("maybe_downscale_cube_faces", t)
+
+        equi, t = timed(py360convert.c2e, cube, width // 2, width, "bilinear", "dict")
+        record("py360convert.c2e", t)
+        del equi
+
+        # cold lookup build, then the cached conversion path main() uses
+        cube_backends.drop_table_caches()
+        _, t = timed(cube_backends.get_cube_sampler, face_size, width)
+        record("lookup", t)
+
+        equi, t = timed(cube_backends.convert_cube_to_equirect, cube, width)
+        record("convert", t)
+
+        _, t = timed(cv2.imwrite, out_path, equi)
+        record("cv2.imwrite", t)
+        del equi
+
+        for backend in backends:
+            cube_backends.drop_table_caches()
+            tracemalloc.start()
+            _, t = timed(cube_backends.convert_cube_to_equirect, cube, width, None, backend)
+            traced[backend] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+            record(f"{backend} cold", t)
+            _, t = timed(cube_backends.convert_cube_to_equirect, cube, width, None, backend)
+            record(backend, t)
+        cube_backends.drop_table_caches()
+        del cube
+
+    os.remove(out_path)
+    return {
+        "face_size": face_size,
+        "width": width,
+        "stages": {
+            name: {"seconds": min(runs), "runs": runs} for name, runs in stages.items()
+        },
+        "peak_rss_mb": rss,
+        "backend_traced_mb": traced,
+        "megapixels_out": width * (width // 2) / 1e6,
+    }
+
+
+def parse_int_list(text):
+    return tuple(int(x) for x in text.split(",") if x.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark the cube -> equirect pipeline stages (decode, downscale, "
+            "conversion, encode) on synthetic cube faces and write JSON results."
+        )
+    )
+    parser.add_argument(
+        "--faces",
+        type=parse_int_list,
+        default=DEFAULT_FACE_SIZES,
+        help=f"Comma separated face sizes. Default {','.join(map(str, DEFAULT_FACE_SIZES))}.",
+    )
+    parser.add_argument(
+        "--widths",
+        type=parse_int_list,
+        default=DEFAULT_WIDTHS,
+        help=f"Comma separated output widths. Default {','.join(map(str, DEFAULT_WIDTHS))}.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs per case; the fastest is reported, all are kept. Default 3.",
+    )
+    parser.add_argument(
+        "--backends",
+        type=str,
+        default=",".join(
+            b for b in cube_backends.BACKENDS if b != "numba" or cube_backends.njit is not None
+        ),
+        help=(
+            "Comma separated conversion backends to compare, empty for none. "
+            "Default every backend available here."
+        ),
+    )
+    parser.add_argument(
+        "--workdir",
+        type=str,
+        default=None,
+        help="Where synthetic faces are generated and kept. Default a temp directory.",
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default="bench_cube_to_equirect.json",
+        help="JSON results file. Default bench_cube_to_equirect.json.",
+    )
+    args = parser.parse_args()
+    backends = [b for b in args.backends.split(",") if b.strip()]
+
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "bench_cube_to_equirect")
+    os.makedirs(workdir, exist_ok=True)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": dict(machine_info(), opencv_threads=cv2.getNumThreads()),
+        "versions": library_versions(),
+        "repeat": args.repeat,
+        "backends": backends,
+        "cases": [],
+    }
+
+    # a fresh process per case keeps the peak RSS figures separate
+    ctx = multiprocessing.get_context("spawn")
+    for face_size in args.faces:
+        face_dir = os.path.join(workdir, f"faces_{face_size}")
+        print(f"Preparing {face_size} px synthetic faces in {face_dir}...")
+        faces = make_synthetic_faces(face_dir, face_size)
+
+        for width in args.widths:
+            print(f"Benchmarking faces {face_size} px -> width {width}...")
+            with ctx.Pool(1) as pool:
+                case = pool.apply(
+                    run_case, (face_dir, faces, face_size, width, args.repeat, workdir, backends)
+                )
+            results["cases"].append(case)
+            for name, stage in case["stages"].items():
+                rss = case["peak_rss_mb"].get(name)
+                rss_text = f", peak RSS {rss:.0f} MB" if rss is not None else ""
+                print(f"  {name:<28} {stage['seconds']:8.3f} s{rss_text}")
+            for backend, mb in case["backend_traced_mb"].items():
+                print(f"  {backend + ' tables + frame':<28} {mb:8.0f} MB traced")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,763 @@
+"""
+Cube to equirect sampling for cube_to_equirect: the (face, u, v) lookup
+and the tables built from it, cached per (face size, width) and
+optionally stored as memory-mapped .npy files, and the conversion
+backends (py360convert, numpy, remap, numba) that sample through them.
+"""
+
+import math
+import os
+
+import cv2
+import numpy as np
+from py360convert.utils import CubeFaceSampler
+
+try:
+    from numba import config as numba_config, njit, prange, set_num_threads
+    NUMBA_NUM_THREADS = numba_config.NUMBA_NUM_THREADS
+except ImportError:  # optional, only used by --backend numba
+    njit = None
+    prange = range
+
+
+# --interpolation choices; lanczos needs the remap backend
+INTERPOLATIONS = {"bilinear": cv2.INTER_LINEAR, "lanczos": cv2.INTER_LANCZOS4}
+
+
+# Face order of the stacked cube and of the lookup face indices (py360convert order)
+CUBE_FACE_ORDER = "FRBLUD"
+
+# Rows computed per step while building a lookup table, bounds float temporaries
+LOOKUP_CHUNK_ROWS = 256
+
+# In-memory caches, keyed by (face_w, width)
+_lookup_cache = {}
+_sampler_cache = {}
+
+
+def equirect_axes(face_w, width, row_start=0, row_stop=None):
+    """
+    The per-column and per-row terms of py360convert's c2e grid
+    (CubeFaceSampler.from_equirec) for equirect rows [row_start, row_stop),
+    so that lookups and kernels built from them sample exactly like c2e.
+
+    Returns (columns, rows):
+      columns - side face (0F 1R 2B 3L, as equirect_facetype), how many
+                rows from the top (bottom) belong to U (D), the side face
+                x position and the cosine of its angle (float64), and
+                sin / cos of the longitude
+      rows    - the side face y position before dividing by that cosine,
+                and the distance factor of the U / D faces
+    """
+
+    height = width // 2
+    if row_stop is None:
+        row_stop = height
+    w4, w8 = width // 4, width // 8
+    half = face_w / 2
+
+    lon = np.linspace(-np.pi, np.pi, num=width, dtype=np.float32)
+    lat = np.linspace(np.pi / 2, -np.pi / 2, num=height, dtype=np.float32)[row_start:row_stop]
+
+    # side faces 2 3 3 0 0 1 1 2 in eighths of the width
+    side = np.full(width, 2, np.uint8)
+    for f, start in ((3, w8), (0, w8 + w4), (1, w8 + 2 * w4)):
+        side[start:start + w4] = f
+    # U / D reach down (up) to this row, in a pattern repeating every w4
+    # columns, never past a third of the height
+    ceil = np.linspace(-np.pi, np.pi, w4) / 4
+    ceil = np.round(height / 2 - np.arctan(np.cos(ceil)) * height / np.pi).astype(np.int32)
+    cols = np.arange(width)
+    polar = np.minimum(ceil, height // 3)[np.where(cols < w8, cols + w8, cols - w8) % w4]
+
+    angle = lon - np.pi / 2 * side.astype(np.int32)
+    side_x = (half * np.tan(angle)).astype(np.float32)
+    side_cos = np.cos(angle)
+    side_y = -half * np.tan(lat)
+    polar_c = half * np.tan(np.pi / 2 - np.abs(lat))
+    return (side, polar, side_x, side_cos, np.sin(lon), np.cos(lon)), (side_y, polar_c)
+
+
+def compute_equirect_lookup(face_w, width, row_start=0, row_stop=None):
+    """
+    Compute the cube sampling lookup for equirect rows [row_start, row_stop).
+
+    Returns (face, u, v), each shaped (rows, width):
+      face - uint8 index into CUBE_FACE_ORDER
+      u, v - float32 column/row position on that face in pixels, pixel
+             centers at i, clipped to 0..face_w
+
+    These are the faces and positions py360convert.c2e samples, bit for bit.
+    """
+
+    height = width // 2
+    if row_stop is None:
+        row_stop = height
+    (side, polar, side_x, side_cos, sin_lon, cos_lon), (side_y, polar_c) = equirect_axes(
+        face_w, width, row_start, row_stop
+    )
+
+    rows = np.arange(row_start, row_stop)[:, None]
+    up = rows < polar
+    down = rows >= height - polar
+    face = np.repeat(side[None, :], row_stop - row_start, axis=0)
+    face[up] = 4
+    face[down] = 5
+
+    u = np.empty(face.shape, np.float32)
+    v = np.empty(face.shape, np.float32)
+    u[:] = side_x
+    v[:] = side_y[:, None] / side_cos
+    polar_u = polar_c[:, None] * sin_lon
+    polar_v = polar_c[:, None] * cos_lon
+    u[up] = polar_u[up]
+    v[up] = polar_v[up]
+    u[down] = polar_u[down]
+    v[down] = -polar_v[down]
+
+    half = np.float32(face_w / 2)
+    u += half
+    v += half
+    u.clip(0, face_w, out=u)
+    v.clip(0, face_w, out=v)
+    return face, u, v
+
+
+def load_tables(stem, names):
+    """
+    Arrays saved by save_tables() as <stem>_<name>.npy, memory-mapped
+    read-only: processes loading the same file share its pages instead of
+    each holding a copy. None if a file is missing or unreadable.
+    """
+
+    paths = [f"{stem}_{name}.npy" for name in names]
+    if not all(os.path.isfile(p) for p in paths):
+        return None
+    try:
+        return tuple(np.load(p, mmap_mode="r") for p in paths)
+    except Exception as e:
+        print(f"  Could not load table cache {stem}_*.npy: {e}")
+        return None
+
+
+def save_tables(stem, names, arrays):
+    """
+    Store arrays as <stem>_<name>.npy. Each file is written under a
+    per-process temp name and renamed into place, so concurrent workers
+    never load a partial table.
+    """
+
+    try:
+        os.makedirs(os.path.dirname(stem), exist_ok=True)
+        for name, arr in zip(names, arrays):
+            path = f"{stem}_{name}.npy"
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp, path)
+    except Exception as e:
+        print(f"  Could not write table cache {stem}_*.npy: {e}")
+
+
+def get_equirect_lookup(face_w, width, cache_dir=None):
+    """
+    Return the full-frame (face, u, v) lookup for a (face_w, width) pair.
+
+    Tables are built once per process and kept in memory. If cache_dir is
+    given they are also stored there as .npy files and loaded (memory-mapped)
+    on later runs or by other worker processes.
+    """
+
+    key = (face_w, width)
+    if key in _lookup_cache:
+        return _lookup_cache[key]
+
+    names = ("face", "u", "v")
+    stem = os.path.join(cache_dir, f"lut_{face_w}_{width}") if cache_dir else None
+    lookup = load_tables(stem, names) if stem else None
+    if lookup is not None:
+        _lookup_cache[key] = lookup
+        return lookup
+
+    height = width // 2
+    face = np.empty((height, width), dtype=np.uint8)
+    u = np.empty((height, width), dtype=np.float32)
+    v = np.empty((height, width), dtype=np.float32)
+    for start in range(0, height, LOOKUP_CHUNK_ROWS):
+        stop = min(height, start + LOOKUP_CHUNK_ROWS)
+        face[start:stop], u[start:stop], v[start:stop] = compute_equirect_lookup(
+            face_w, width, start, stop
+        )
+
+    lookup = (face, u, v)
+    _lookup_cache[key] = lookup
+    if stem:
+        save_tables(stem, names, lookup)
+    return lookup
+
+
+def get_cube_sampler(face_w, width, cache_dir=None):
+    """
+    Return a py360convert CubeFaceSampler for a (face_w, width) pair,
+    built from the cached lookup and reused for every scene of that size.
+    """
+
+    key = (face_w, width)
+    sampler = _sampler_cache.get(key)
+    if sampler is None:
+        face, u, v = get_equirect_lookup(face_w, width, cache_dir)
+        sampler = CubeFaceSampler(face, u, v, 1, face_w, face_w)
+        _sampler_cache[key] = sampler
+    return sampler
+
+
+def check_cube_faces(cube):
+    """Return the face size; all six faces must be square and equally sized."""
+
+    shapes = {img.shape for img in cube.values()}
+    shape = next(iter(shapes))
+    if len(shapes) != 1 or shape[0] != shape[1]:
+        raise ValueError("Cube faces must be square and equally sized.")
+    return shape[1]
+
+
+# Each face's border, taken from its neighbours as in py360convert's
+# CubeFaceSampler._pad: (face, side, source face, source side, reversed).
+# Above/below come first; left/right then copy full padded lines, corners
+# included.
+CUBE_SEAMS = (
+    ("F", "top", "U", "bottom", False), ("F", "bottom", "D", "top", False),
+    ("R", "top", "U", "right", True), ("R", "bottom", "D", "right", False),
+    ("B", "top", "U", "top", True), ("B", "bottom", "D", "bottom", True),
+    ("L", "top", "U", "left", False), ("L", "bottom", "D", "left", True),
+    ("U", "top", "B", "top", True), ("U", "bottom", "F", "top", False),
+    ("D", "top", "F", "bottom", False), ("D", "bottom", "B", "bottom", True),
+    ("F", "left", "L", "right", False), ("F", "right", "R", "left", False),
+    ("R", "left", "F", "right", False), ("R", "right", "B", "left", False),
+    ("B", "left", "R", "right", False), ("B", "right", "L", "left", False),
+    ("L", "left", "B", "right", False), ("L", "right", "F", "left", False),
+    ("U", "left", "L", "top", False), ("U", "right", "R", "top", True),
+    ("D", "left", "L", "bottom", True), ("D", "right", "R", "bottom", False),
+)
+
+
+def pad_cube_faces(cube, pad=1, out=None):
+    """
+    Stack the faces in CUBE_FACE_ORDER with pad pixels of border taken from
+    the neighbouring faces, so bilinear (or wider) sampling blends across
+    the seams. With pad=1 this is exactly py360convert's padding.
+
+    Returns an array (6, face_w + 2*pad, face_w + 2*pad, channels), or
+    fills out, six such arrays (e.g. atlas cells) in CUBE_FACE_ORDER.
+    """
+
+    face_w = check_cube_faces(cube)
+    size = face_w + 2 * pad
+    sample = cube["F"]
+    padded = out
+    if padded is None:
+        padded = np.empty((len(CUBE_FACE_ORDER), size, size) + sample.shape[2:], dtype=sample.dtype)
+    for idx, key in enumerate(CUBE_FACE_ORDER):
+        padded[idx][pad:pad + face_w, pad:pad + face_w] = cube[key]
+
+    # lines next to an edge, nearest first, over the full padded length
+    inner = {"near": slice(pad, 2 * pad), "far": slice(face_w + pad - 1, face_w - 1, -1)}
+    outer = {"near": slice(pad - 1, None, -1), "far": slice(face_w + pad, size)}
+
+    def lines(key, side):
+        face = padded[CUBE_FACE_ORDER.index(key)]
+        # columns are the lines of the left and right sides
+        if side in ("left", "right"):
+            face = face.swapaxes(0, 1)
+        return face, "near" if side in ("top", "left") else "far"
+
+    for key, side, src_key, src_side, reverse in CUBE_SEAMS:
+        src, src_end = lines(src_key, src_side)
+        strip = src[inner[src_end]]
+        if reverse:
+            strip = strip[:, ::-1]
+        dst, dst_end = lines(key, side)
+        dst[outer[dst_end]] = strip
+    return padded
+
+
+# Output pixels per step of sample_cube_numpy, keeps its temporaries in cache
+SAMPLE_CHUNK_PIXELS = 8192
+# Bilinear weights in 1/32 px, as cv2.remap's fixed-point maps
+WEIGHT_BITS = 5
+
+_plan_cache = {}
+
+
+def stack_positions(face_w, face, u, v):
+    """
+    Positions of a (face, u, v) lookup in the pad_cube_faces(cube, 1)
+    stack seen as one tall image, as int32 (ix, iy) in 1/32 px. They are
+    rounded exactly as CubeFaceSampler's CV_16SC2 maps, so engines
+    sampling through them reproduce py360convert's output.
+    """
+
+    size = face_w + 2
+    # padding shifts positions by one pixel; faces are stacked vertically
+    x = u + np.float32(1)
+    y = v + np.float32(1)
+    y += np.multiply(face, size, dtype=np.float32)
+    scale = np.float32(1 << WEIGHT_BITS)
+    return np.rint(x * scale).astype(np.int32), np.rint(y * scale).astype(np.int32)
+
+
+def build_gather_plan(face_w, face, u, v):
+    """
+    Turn a (face, u, v) lookup into a compact gather plan for
+    sample_cube_numpy, 6 bytes per output pixel:
+
+      idx    - flat top-left source pixel in the pad_cube_faces(cube, 1)
+               stack (int32, int64 for faces over ~18900 px)
+      wx, wy - uint8 bilinear weights of the right / lower neighbour,
+               in 1/32 px, from stack_positions()
+    """
+
+    size = face_w + 2
+    stack = len(CUBE_FACE_ORDER) * size * size
+    ix, iy = stack_positions(face_w, face, u, v)
+    ix = ix.ravel()
+    iy = iy.ravel()
+
+    mask = (1 << WEIGHT_BITS) - 1
+    wx = (ix & mask).astype(np.uint8)
+    wy = (iy & mask).astype(np.uint8)
+    ix >>= WEIGHT_BITS
+    iy >>= WEIGHT_BITS
+    # positions clipped to the last column / row of the stack read it
+    # with full weight from the left / upper neighbour, not past its end
+    for pos, weight, last in ((ix, wx, size - 1), (iy, wy, len(CUBE_FACE_ORDER) * size - 1)):
+        edge = pos == last
+        pos[edge] -= 1
+        weight[edge] = 1 << WEIGHT_BITS
+    idx = iy.astype(np.int32 if stack < 2 ** 31 else np.int64)
+    idx *= size
+    idx += ix
+    return idx, wx, wy
+
+
+def get_gather_plan(face_w, width, cache_dir=None):
+    """
+    sample_cube_numpy plan for a (face_w, width) pair, built band by band
+    (no full-frame lookup is kept) once per process; like the lookup,
+    stored in and memory-mapped from cache_dir if given.
+    """
+
+    key = (face_w, width)
+    plan = _plan_cache.get(key)
+    if plan is not None:
+        return plan
+
+    names = ("idx", "wx", "wy")
+    stem = os.path.join(cache_dir, f"plan_{face_w}_{width}") if cache_dir else None
+    plan = load_tables(stem, names) if stem else None
+    if plan is None:
+        height = width // 2
+        plan = None
+        for start in range(0, height, LOOKUP_CHUNK_ROWS):
+            stop = min(height, start + LOOKUP_CHUNK_ROWS)
+            band = build_gather_plan(face_w, *compute_equirect_lookup(face_w, width, start, stop))
+            if plan is None:
+                plan = tuple(np.empty(height * width, dtype=a.dtype) for a in band)
+            for table, part in zip(plan, band):
+                table[start * width:stop * width] = part
+        if stem:
+            save_tables(stem, names, plan)
+    _plan_cache[key] = plan
+    return plan
+
+
+def sample_cube_numpy(faces, plan, out):
+    """
+    Bilinear sampling of the padded cube stack from pad_cube_faces(cube, 1)
+    into out (rows, width, channels) through a build_gather_plan() plan
+    for the same pixels.
+
+    Works through SAMPLE_CHUNK_PIXELS pixels at a time, so temporaries stay
+    small. 8-bit faces use cv2.remap's integer arithmetic and match it
+    exactly; other dtypes are blended in float32.
+    """
+
+    idx, wx, wy = plan
+    channels = out.shape[2]
+    src = faces.reshape(-1, channels)
+    row = faces.shape[2]
+    out_flat = out.reshape(-1, channels)
+    one = 1 << WEIGHT_BITS
+    exact = src.dtype == np.uint8 and out.dtype == np.uint8
+
+    for start in range(0, idx.size, SAMPLE_CHUNK_PIXELS):
+        stop = start + SAMPLE_CHUNK_PIXELS
+        i = idx[start:stop]
+        if exact:
+            # x blend in uint16, y blend in uint32 with 10 fractional bits
+            ax = wx[start:stop, None].astype(np.uint16)
+            bx = one - ax
+            ay = wy[start:stop, None].astype(np.uint32)
+            by = one - ay
+        else:
+            ax = wx[start:stop, None] / np.float32(one)
+            bx = 1 - ax
+            ay = wy[start:stop, None] / np.float32(one)
+            by = 1 - ay
+        # np.take is much faster than fancy indexing for row gathers
+        top = np.take(src, i, axis=0) * bx
+        top += np.take(src, i + 1, axis=0) * ax
+        i = i + row
+        bottom = np.take(src, i, axis=0) * bx
+        bottom += np.take(src, i + 1, axis=0) * ax
+        top = top * by
+        top += bottom * ay
+        if exact:
+            top += 1 << (2 * WEIGHT_BITS - 1)
+            top >>= 2 * WEIGHT_BITS
+        elif np.issubdtype(out.dtype, np.integer):
+            top += 0.5
+        out_flat[start:stop] = top
+    return out
+
+
+def convert_cube_to_equirect(cube, width, cache_dir=None, backend="py360convert",
+                             interpolation="bilinear"):
+    """
+    Sample the cube dict from load_cube_faces into a width x width/2
+    equirectangular image with the same dtype as the faces.
+
+    backend is one of BACKENDS:
+      py360convert - py360convert's CubeFaceSampler, built once per size
+      numpy        - sample_cube_numpy with a cached gather plan
+      remap        - cv2.remap over a face atlas with cached fixed-point maps
+      numba        - _numba_cube_kernel, falls back to numpy without Numba
+
+    interpolation is a key of INTERPOLATIONS; only remap offers lanczos.
+    """
+
+    face_w = check_cube_faces(cube)
+    height = width // 2
+    channels = cube["F"].shape[2]
+    dtype = cube["F"].dtype
+
+    if backend == "py360convert":
+        faces = np.stack([cube[k] for k in CUBE_FACE_ORDER])
+        sampler = get_cube_sampler(face_w, width, cache_dir)
+        equi = np.empty((height, width, channels), dtype=dtype)
+        for c in range(channels):
+            equi[..., c] = sampler(faces[..., c])
+        return equi
+
+    if backend == "numpy":
+        plan = get_gather_plan(face_w, width, cache_dir)
+        equi = np.empty((height, width, channels), dtype=dtype)
+        return sample_cube_numpy(pad_cube_faces(cube), plan, equi)
+
+    if backend == "remap":
+        maps = get_remap_maps(face_w, width, cache_dir)
+        equi = np.empty((height, width, channels), dtype=dtype)
+        return sample_cube_remap(build_atlases(cube, face_w), maps, equi, interpolation)
+
+    if backend == "numba":
+        if njit is None:
+            return convert_cube_to_equirect(cube, width, cache_dir, "numpy", interpolation)
+        equi = np.empty((height, width, channels), dtype=dtype)
+        return sample_cube_numba(pad_cube_faces(cube), equi)
+
+    raise ValueError(f"Unknown conversion backend: {backend}")
+
+
+# --backend choices, see convert_cube_to_equirect()
+BACKENDS = ("py360convert", "numpy", "remap", "numba")
+
+# cv2.remap and its CV_16SC2 maps address source pixels with int16
+REMAP_MAX_DIM = 32767
+# Border around each atlas face, covers Lanczos' 8x8 kernel
+ATLAS_PAD = 4
+# Largest face the remap backend takes (one face per atlas)
+REMAP_MAX_FACE = REMAP_MAX_DIM - 2 * ATLAS_PAD
+# Largest face sample_cube_band takes, with its one-pixel border
+BAND_MAX_FACE = REMAP_MAX_DIM - 2
+# Width of the maps sample_cube_band gathers each face's pixels into
+BAND_MAP_COLS = 16384
+
+_remap_cache = {}
+
+
+def atlas_layout(face_w):
+    """
+    Pack the six faces (CUBE_FACE_ORDER) into as few atlases as fit
+    within REMAP_MAX_DIM: one 3x2 atlas up to 10914 px faces, 2x2 atlases
+    up to 16375 px, one face per atlas above that.
+
+    Returns (cols, [face indices per atlas]).
+    """
+
+    per_side = REMAP_MAX_DIM // (face_w + 2 * ATLAS_PAD)
+    if per_side < 1:
+        raise ValueError(f"Cube faces of {face_w} px exceed the cv2.remap limit of {REMAP_MAX_FACE} px.")
+    cols = min(3, per_side)
+    per_atlas = cols * min(math.ceil(len(CUBE_FACE_ORDER) / cols), per_side)
+    faces = list(range(len(CUBE_FACE_ORDER)))
+    return cols, [faces[i:i + per_atlas] for i in range(0, len(faces), per_atlas)]
+
+
+def build_atlases(cube, face_w):
+    """
+    The cube's faces packed per atlas_layout(), with a border taken from
+    the neighbouring faces (pad_cube_faces), so sampling blends across
+    the seams like py360convert.
+    """
+
+    cols, groups = atlas_layout(face_w)
+    cell = face_w + 2 * ATLAS_PAD
+    sample = cube["F"]
+    atlases = []
+    cells = [None] * len(CUBE_FACE_ORDER)
+    for faces in groups:
+        rows = math.ceil(len(faces) / cols)
+        atlas = np.empty((rows * cell, cols * cell) + sample.shape[2:], dtype=sample.dtype)
+        for slot, idx in enumerate(faces):
+            y = slot // cols * cell
+            x = slot % cols * cell
+            cells[idx] = atlas[y:y + cell, x:x + cell]
+        atlases.append(atlas)
+    pad_cube_faces(cube, ATLAS_PAD, cells)
+    return atlases
+
+
+def build_remap_maps(face_w, face, u, v):
+    """
+    Turn a (face, u, v) lookup into fixed-point cv2.remap maps into the
+    atlases of atlas_layout(): CV_16SC2 positions plus the CV_16UC1
+    interpolation table (6 bytes per pixel), as convertMaps() would make
+    them. The positions are stack_positions() moved into the atlas cells,
+    so bilinear output matches py360convert.
+
+    Returns [(map1, map2, mask), ...] per atlas; mask selects the output
+    pixels an atlas covers and is None when one atlas holds all faces.
+    Several atlases share the same maps, as their slots coincide.
+    """
+
+    cols, groups = atlas_layout(face_w)
+    cell = face_w + 2 * ATLAS_PAD
+    size = face_w + 2
+    shift_x = np.zeros(len(CUBE_FACE_ORDER), np.int32)
+    shift_y = np.zeros(len(CUBE_FACE_ORDER), np.int32)
+    atlas_of = np.zeros(len(CUBE_FACE_ORDER), np.uint8)
+    for a, faces in enumerate(groups):
+        for slot, idx in enumerate(faces):
+            # from the face's one-pixel border in the stack to its atlas cell
+            shift_x[idx] = (slot % cols * cell + ATLAS_PAD - 1) << WEIGHT_BITS
+            shift_y[idx] = (slot // cols * cell + ATLAS_PAD - 1 - idx * size) << WEIGHT_BITS
+            atlas_of[idx] = a
+
+    ix, iy = stack_positions(face_w, face, u, v)
+    ix += shift_x[face]
+    iy += shift_y[face]
+    mask = (1 << WEIGHT_BITS) - 1
+    map2 = ((iy & mask) << WEIGHT_BITS | ix & mask).astype(np.uint16)
+    # every atlas fits REMAP_MAX_DIM, so one set of maps serves them all
+    map1 = np.empty(face.shape + (2,), np.int16)
+    map1[..., 0] = ix >> WEIGHT_BITS
+    map1[..., 1] = iy >> WEIGHT_BITS
+    if len(groups) == 1:
+        return [(map1, map2, None)]
+    return [(map1, map2, atlas_of[face] == a) for a in range(len(groups))]
+
+
+def get_remap_maps(face_w, width, cache_dir=None):
+    """
+    build_remap_maps() over the whole frame, built band by band (no
+    full-frame lookup is kept) once per (face_w, width); like the lookup,
+    stored in and memory-mapped from cache_dir if given.
+    """
+
+    key = (face_w, width)
+    maps = _remap_cache.get(key)
+    if maps is not None:
+        return maps
+
+    atlases = len(atlas_layout(face_w)[1])
+    names = ["map1", "map2"] + [f"mask{a}" for a in range(atlases) if atlases > 1]
+    stem = os.path.join(cache_dir, f"remap_{face_w}_{width}") if cache_dir else None
+    tables = load_tables(stem, names) if stem else None
+    if tables is not None:
+        map1, map2 = tables[:2]
+        masks = tables[2:] or (None,)
+        maps = [(map1, map2, mask) for mask in masks]
+    else:
+        height = width // 2
+        map1 = np.empty((height, width, 2), np.int16)
+        map2 = np.empty((height, width), np.uint16)
+        masks = [np.empty((height, width), bool) for _ in range(atlases)] if atlases > 1 else [None]
+        for start in range(0, height, LOOKUP_CHUNK_ROWS):
+            stop = min(height, start + LOOKUP_CHUNK_ROWS)
+            band = build_remap_maps(face_w, *compute_equirect_lookup(face_w, width, start, stop))
+            map1[start:stop], map2[start:stop] = band[0][:2]
+            for mask, (_, _, rows) in zip(masks, band):
+                if mask is not None:
+                    mask[start:stop] = rows
+        maps = [(map1, map2, mask) for mask in masks]
+        if stem:
+            save_tables(stem, names, [map1, map2] + [m for m in masks if m is not None])
+    _remap_cache[key] = maps
+    return maps
+
+
+def sample_cube_remap(atlases, maps, out, interpolation="bilinear"):
+    """Sample the atlases from build_atlases() into out through their remap maps."""
+
+    flag = INTERPOLATIONS[interpolation]
+    for atlas, (map1, map2, mask) in zip(atlases, maps):
+        if mask is None:
+            cv2.remap(atlas, map1, map2, flag, dst=out, borderMode=cv2.BORDER_REPLICATE)
+        else:
+            sampled = cv2.remap(atlas, map1, map2, flag, borderMode=cv2.BORDER_REPLICATE)
+            out[mask] = sampled[mask]
+    return out
+
+
+def sample_cube_band(faces, face_w, face, u, v, out):
+    """
+    Sample one band of the equirect into out (rows, width, channels)
+    from its (face, u, v) lookup band and the pad_cube_faces(cube, 1)
+    stack, through stack_positions(), so the output matches py360convert.
+
+    Each padded face is remapped on its own, for just its pixels, instead
+    of as one stacked image, so faces up to BAND_MAX_FACE px need no
+    downscaling.
+    """
+
+    ix, iy = stack_positions(face_w, face, u, v)
+    # from the stack to the face's own padded image, exact in 1/32 px
+    iy -= face.astype(np.int32) * ((face_w + 2) << WEIGHT_BITS)
+    mask = (1 << WEIGHT_BITS) - 1
+    channels = out.shape[2]
+    for idx in range(len(CUBE_FACE_ORDER)):
+        pixels = face == idx
+        if not pixels.any():
+            continue
+        x = ix[pixels]
+        y = iy[pixels]
+        # the face's pixels as rows of a map, as remap's maps stay under 32767 rows
+        count = x.size
+        cols = min(count, BAND_MAP_COLS)
+        rows = -(-count // cols)
+        x = np.pad(x, (0, rows * cols - count), mode="edge").reshape(rows, cols)
+        y = np.pad(y, (0, rows * cols - count), mode="edge").reshape(rows, cols)
+        map1 = np.stack([x >> WEIGHT_BITS, y >> WEIGHT_BITS], axis=-1).astype(np.int16)
+        map2 = ((y & mask) << WEIGHT_BITS | x & mask).astype(np.uint16)
+        sampled = cv2.remap(faces[idx], map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        out[pixels] = sampled.reshape(-1, channels)[:count]
+    return out
+
+
+def _numba_cube_kernel(faces, out, row_start, height, columns, rows, rounding):
+    """
+    Per-pixel bilinear cube sampling into out, parallel over rows. faces
+    is the pad_cube_faces(cube, 1) stack seen as one tall image; columns
+    and rows are equirect_axes() for the rows of out, from NumPy. The
+    math mirrors compute_equirect_lookup and stack_positions, computed
+    inline so no lookup table is needed, with cv2.remap's 1/32 px
+    weights; 8-bit results match py360convert's.
+    """
+
+    side, polar, side_x, side_cos, sin_lon, cos_lon = columns
+    side_y, polar_c = rows
+    out_rows, width, channels = out.shape
+    size = faces.shape[1]
+    last_row = faces.shape[0] - 1
+    face_w = np.float32(size - 2)
+    half = np.float32((size - 2) / 2.0)
+    zero = np.float32(0.0)
+    scale = np.float32(1 << WEIGHT_BITS)
+    one = 1 << WEIGHT_BITS
+    mask = one - 1
+    norm = np.float32(1.0 / (one * one))
+    for r in prange(out_rows):
+        row = row_start + r
+        for col in range(width):
+            # 0F 1R 2B 3L 4U 5D, (u, v) as in compute_equirect_lookup
+            if row < polar[col]:
+                f = 4
+                u = polar_c[r] * sin_lon[col]
+                v = polar_c[r] * cos_lon[col]
+            elif row >= height - polar[col]:
+                f = 5
+                u = polar_c[r] * sin_lon[col]
+                v = -(polar_c[r] * cos_lon[col])
+            else:
+                f = side[col]
+                u = side_x[col]
+                v = np.float32(side_y[r] / side_cos[col])
+            u = min(max(u + half, zero), face_w)
+            v = min(max(v + half, zero), face_w)
+
+            # position in the padded stack, rounded to 1/32 px
+            px = u + np.float32(1.0)
+            py = (v + np.float32(1.0)) + np.float32(f * size)
+            ix = int(np.rint(px * scale))
+            iy = int(np.rint(py * scale))
+            x0 = ix >> WEIGHT_BITS
+            y0 = iy >> WEIGHT_BITS
+            wx = ix & mask
+            wy = iy & mask
+            # on the last column / row, the same pixel from its left / upper neighbour
+            if x0 >= size - 1:
+                x0 = size - 2
+                wx = one
+            if y0 >= last_row:
+                y0 = last_row - 1
+                wy = one
+            # integer weights, exact in float32 for 8-bit faces
+            w00 = np.float32((one - wx) * (one - wy))
+            w01 = np.float32(wx * (one - wy))
+            w10 = np.float32((one - wx) * wy)
+            w11 = np.float32(wx * wy)
+
+            for c in range(channels):
+                acc = np.float32(faces[y0, x0, c]) * w00 + np.float32(faces[y0, x0 + 1, c]) * w01 \
+                    + np.float32(faces[y0 + 1, x0, c]) * w10 + np.float32(faces[y0 + 1, x0 + 1, c]) * w11
+                out[r, col, c] = acc * norm + rounding
+    return out
+
+
+if njit is not None:
+    # cache=True keeps the compiled kernel in __pycache__ (or NUMBA_CACHE_DIR),
+    # so the compile cost is paid once per machine and face dtype
+    _numba_cube_kernel = njit(parallel=True, cache=True, nogil=True)(_numba_cube_kernel)
+
+
+def sample_cube_numba(faces, out, row_start=0, height=None):
+    """
+    Sample the pad_cube_faces(cube, 1) stack into out (rows, width,
+    channels), rows row_start.. of the equirect, with the Numba kernel.
+    Needs numba installed.
+    """
+
+    width = out.shape[1]
+    if height is None:
+        height = width // 2
+    # a single C-contiguous image, as the kernel indexes it
+    faces = np.ascontiguousarray(faces.reshape((-1,) + faces.shape[2:]))
+    # the trig comes from NumPy, exactly as in compute_equirect_lookup
+    columns, rows = equirect_axes(faces.shape[1] - 2, width, row_start, row_start + out.shape[0])
+    rounding = 0.5 if np.issubdtype(out.dtype, np.integer) else 0.0
+    return _numba_cube_kernel(faces, out, row_start, height, columns, rows, rounding)
+
+
+def set_numba_threads(threads):
+    """Let the Numba kernel use up to threads threads; nothing without numba."""
+
+    if njit is not None:
+        set_num_threads(min(threads, NUMBA_NUM_THREADS))
+
+
+def drop_table_caches(keep=None):
+    """Forget the in-process sampling tables, except those for the (face_w, width) key keep."""
+
+    for cache in (_lookup_cache, _sampler_cache, _plan_cache, _remap_cache):
+        for key in [k for k in cache if k != keep]:
+            del cache[key]
@@ -0,0 +1,255 @@
+"""
+Cube face sets for cube_to_equirect: finding <Base>1..6.jpg sets, sizing
+them from their JPEG headers and loading them, decoded and resized on a
+thread pool.
+"""
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from pano_metrics import timed_stage
+
+
+def find_cube_sets(base_dir):
+    """
+    Find all complete cube-face sets in base_dir.
+
+    Expected JPG names look like:
+      Scene431.jpg .. Scene436.jpg   -> base 'Scene43'
+      Scene321.jpg .. Scene326.jpg   -> base 'Scene32'
+      Scene211.jpg .. Scene216.jpg   -> base 'Scene21'
+      Edit01.jpg  .. Edit06.jpg      -> base 'Edit0'
+      pano131.jpg .. pano136.jpg     -> base 'pano13'
+      pano91.jpg  .. pano96.jpg      -> base 'pano9'
+
+    Rule:
+      stem = filename without extension
+      last character 1..6 = face index
+      base = stem without last character
+    """
+
+    sets = {}
+
+    for fname in os.listdir(base_dir):
+        if not fname.lower().endswith(".jpg"):
+            continue
+
+        stem, _ = os.path.splitext(fname)
+        if not stem:
+            continue
+
+        last = stem[-1]
+        if last not in "123456":
+            continue
+
+        face_idx = int(last)
+        base = stem[:-1]
+        if not base:
+            continue
+
+        sets.setdefault(base, {})[face_idx] = fname
+
+    complete_sets = {b: f for b, f in sets.items() if len(f) == 6}
+    return complete_sets
+
+
+# Threads decoding / resizing the faces of one cube; OpenCV releases the GIL
+FACE_THREADS = 6
+
+
+def map_cube_faces(fn, items):
+    """
+    Run fn(value) for every (key, value) of items on a thread pool and
+    return {key: result} in the same key order.
+
+    Every face is attempted; failures are reported together, one
+    "key: error" line per face (FileNotFoundError if all faces failed
+    to read, RuntimeError otherwise).
+    """
+
+    with ThreadPoolExecutor(max_workers=FACE_THREADS) as pool:
+        futures = [(key, pool.submit(fn, value)) for key, value in items]
+
+    results = {}
+    errors = []
+    for key, future in futures:
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            errors.append((key, e))
+    if errors:
+        message = "; ".join(f"{key}: {e}" for key, e in errors)
+        if all(isinstance(e, FileNotFoundError) for _, e in errors):
+            raise FileNotFoundError(message)
+        raise RuntimeError(message)
+    return results
+
+
+def maybe_downscale_cube_faces(cube, max_dim=30000, log=print):
+    """
+    OpenCV remap has limits around 32767 for width/height.
+    If any cube face is larger than max_dim in either dimension,
+    uniformly downscale all faces so that the largest dimension is <= max_dim.
+    The six resizes run concurrently. Messages go to log.
+    """
+
+    # compute maximum dimension among all faces
+    max_side = 0
+    for img in cube.values():
+        h, w = img.shape[:2]
+        max_side = max(max_side, h, w)
+
+    if max_side <= max_dim:
+        return cube  # nothing to do
+
+    scale = float(max_dim) / float(max_side)
+    log(f"  Cube faces too large (max side {max_side}), downscaling by factor {scale:.4f}")
+
+    def resize(img):
+        h, w = img.shape[:2]
+        new_w = max(1, int(w * scale))
+        new_h = max(1, int(h * scale))
+        return cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+    cube.update(map_cube_faces(resize, cube.items()))
+    return cube
+
+
+# <Base><index>.jpg -> cube key, see load_cube_faces()
+FACE_INDEX_TO_KEY = {3: "R", 1: "L", 5: "U", 6: "D", 4: "F", 2: "B"}
+
+
+# DCT-domain scaled decodes, by reduction factor
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def jpeg_dimensions(path):
+    """(width, height) from a JPEG's SOF header, None if it is not a readable JPEG."""
+
+    try:
+        with open(path, "rb") as f:
+            if f.read(2) != b"\xff\xd8":
+                return None
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                if marker[1] in (0x01, 0xFF) or 0xD0 <= marker[1] <= 0xD7:
+                    continue  # standalone marker / fill byte, no length
+                length = int.from_bytes(f.read(2), "big")
+                # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    header = f.read(5)
+                    return int.from_bytes(header[3:5], "big"), int.from_bytes(header[1:3], "big")
+                f.seek(length - 2, os.SEEK_CUR)
+    except OSError:
+        return None
+
+
+def equirect_face_size(width):
+    """Cube face size a width x width/2 equirect needs: a face spans 90 of its 360 degrees."""
+
+    return max(1, math.ceil(width / 4))
+
+
+def load_cube_faces(base_dir, faces_dict, max_dim=30000, face_size=None, metrics=None, item=None,
+                    log=print):
+    """
+    faces_dict is {1: 'Base1.jpg', ..., 6: 'Base6.jpg'}
+    max_dim and log are passed on to maybe_downscale_cube_faces.
+
+    With face_size, larger faces are read at reduced size: JPEGs are
+    decoded at 1/2, 1/4 or 1/8 scale in the DCT domain (the largest
+    reduction that stays at or above face_size), and whatever remains is
+    resized to face_size with INTER_AREA. Faces are never enlarged.
+
+    With metrics (a pano_metrics.RunMetrics), the decode and downscale
+    stages are recorded for item.
+
+    Orientation mapping (to match your SketchUp/Three.js setup):
+
+      index 3 -> right  (+X) -> "R"
+      index 1 -> left   (-X) -> "L"
+      index 5 -> top    (+Y) -> "U"
+      index 6 -> bottom (-Y) -> "D"
+      index 4 -> +Z (was 'back' in three.js)  -> "F"
+      index 2 -> -Z (was 'front' in three.js) -> "B"
+    """
+
+    def read(fname):
+        path = os.path.join(base_dir, fname)
+        flag = cv2.IMREAD_COLOR
+        size = jpeg_dimensions(path) if face_size else None
+        if size:
+            for factor in sorted(REDUCED_DECODE_FLAGS, reverse=True):
+                # libjpeg scales to ceil(side / factor)
+                if math.ceil(min(size) / factor) >= face_size:
+                    flag = REDUCED_DECODE_FLAGS[factor]
+                    break
+        img = cv2.imread(path, flag)
+        if img is None:
+            raise FileNotFoundError(f"Could not read image: {path}")
+        return img
+
+    def shrink(img):
+        h, w = img.shape[:2]
+        if not face_size or max(h, w) <= face_size:
+            return img
+        scale = face_size / max(h, w)
+        new_size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+
+    names = [(key, faces_dict[index]) for index, key in FACE_INDEX_TO_KEY.items()]
+    bytes_in = sum(os.path.getsize(os.path.join(base_dir, name)) for _, name in names)
+    with timed_stage(metrics, item, "decode", bytes_in=bytes_in) as rec:
+        # the six decodes run concurrently, see map_cube_faces
+        cube = map_cube_faces(read, names)
+        rec["megapixels"] = sum(img.shape[0] * img.shape[1] for img in cube.values()) / 1e6
+
+    with timed_stage(metrics, item, "downscale"):
+        if face_size:
+            cube = map_cube_faces(shrink, cube.items())
+        cube = maybe_downscale_cube_faces(cube, max_dim, log)
+    return cube
+
+
+# --width auto: about 4x the face size, a multiple of this (height a
+# multiple of 32: whole 16 px JPEG MCUs, 4:2:0 chroma and AVIF blocks)
+AUTO_WIDTH_MULTIPLE = 64
+MAX_WIDTH = 32000
+
+
+def auto_width(face_w, max_width=None):
+    """
+    The equirect width matching a face's sampling density: a face spans
+    90 of 360 degrees, so about 4 x face_w, rounded to AUTO_WIDTH_MULTIPLE
+    and capped at max_width (and MAX_WIDTH).
+    """
+
+    cap = min(max_width or MAX_WIDTH, MAX_WIDTH)
+    width = round(4 * face_w / AUTO_WIDTH_MULTIPLE) * AUTO_WIDTH_MULTIPLE
+    width = min(width, cap // AUTO_WIDTH_MULTIPLE * AUTO_WIDTH_MULTIPLE)
+    return max(AUTO_WIDTH_MULTIPLE, width)
+
+
+def cube_face_size(base_dir, faces_dict):
+    """Largest face side of a cube set, from the JPEG headers where possible."""
+
+    sides = []
+    for fname in faces_dict.values():
+        path = os.path.join(base_dir, fname)
+        size = jpeg_dimensions(path)
+        if size is None:
+            img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if img is None:
+                raise FileNotFoundError(f"Could not read image: {path}")
+            size = img.shape[1], img.shape[0]
+        sides.append(max(size))
+    return max(sides)
@@ -0,0 +1,179 @@
+"""
+--max-memory scheduling for cube_to_equirect: peak memory estimates per
+cube set, a plan of worker count and band heights within the budget,
+and the loop that starts bases while their estimates fit.
+"""
+
+import math
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from cube_faces import REDUCED_DECODE_FLAGS, auto_width, cube_face_size, equirect_face_size
+
+
+# --max-memory estimates, fitted to the peak RSS of serial conversions
+# (faces of 512 to 3072 px, equirects 2048 to 12288 px wide, cold tables):
+# bytes per output pixel of a full-frame conversion (tables, frame and
+# encoder buffer) and per pixel of a band (mostly compute_equirect_lookup's
+# float64 temporaries)
+FULL_BYTES_PER_PIXEL = {"py360convert": 34, "numpy": 12, "remap": 13, "numba": 3}
+BAND_BYTES_PER_PIXEL = {"py360convert": 105, "numpy": 105, "remap": 105, "numba": 7}
+# extra copies of the faces a backend makes for a full frame (stacked and
+# padded cube, atlas); banded conversion keeps one padded copy or atlas
+FACE_COPIES = {"py360convert": 2, "numpy": 1, "remap": 1, "numba": 1}
+# memory a conversion needs regardless of its size, most of all numba's compiler
+BACKEND_MEMORY = {
+    "py360convert": 16 * 1024 * 1024,
+    "numpy": 16 * 1024 * 1024,
+    "remap": 16 * 1024 * 1024,
+    "numba": 64 * 1024 * 1024,
+}
+# estimates are raised by this factor, as peaks vary with the images
+MEMORY_MARGIN = 1.2
+# a process with Python, NumPy, OpenCV and Numba loaded (141 MB measured)
+PROCESS_MEMORY = int(MEMORY_MARGIN * 141 * 1024 * 1024)
+# band heights --max-memory picks from, tallest that fits
+BAND_HEIGHTS = (1024, 512, 256, 128, 64, 32, 16)
+
+
+def banding_possible(args):
+    """Whether write_equirect_banded() can produce this run's equirect output."""
+
+    return (
+        args.output in ("equirect", "both")
+        and args.format == "jpg"
+        and not args.progressive
+        and not args.target_size
+    )
+
+
+def estimate_base_memory(face_w, width, args, band_height=0):
+    """
+    Rough peak bytes for converting one base with faces of face_w px to
+    width, from the decode (reduced JPEG decodes included), the faces'
+    copies and the backend's tables; band_height for banded conversion.
+    Includes MEMORY_MARGIN, not PROCESS_MEMORY.
+    """
+
+    face_size = equirect_face_size(width) if args.output == "equirect" else None
+    decoded = face_w
+    if face_size:
+        for factor in sorted(REDUCED_DECODE_FLAGS, reverse=True):
+            if math.ceil(face_w / factor) >= face_size:
+                decoded = math.ceil(face_w / factor)
+                break
+    kept = min(face_w, face_size) if face_size else face_w
+    faces = 6 * kept * kept * 3
+    load = 6 * decoded * decoded * 3 + (faces if decoded > kept else 0)
+
+    work = faces if args.output in ("multires", "both") else 0  # tile levels
+    if args.output in ("equirect", "both"):
+        if band_height:
+            pixels = BAND_BYTES_PER_PIXEL[args.backend] * band_height * width
+            work = max(work, faces + pixels)
+        else:
+            pixels = FULL_BYTES_PER_PIXEL[args.backend] * width * (width // 2)
+            work = max(work, faces * FACE_COPIES[args.backend] + pixels)
+        work += BACKEND_MEMORY[args.backend]
+    return int(MEMORY_MARGIN * max(load, faces + work))
+
+
+def plan_memory(base_dir, cube_sets, args, budget):
+    """
+    Schedule the cube sets within budget bytes: estimate each base from
+    its JPEG headers, pick how many worker processes fit, and give bases
+    that cannot fit next to them even alone a band height (if banding is
+    possible). Updates args.jobs.
+
+    Returns [(base, faces_dict, estimate, band_height, tables)], largest
+    first, so the big bases do not end up running last on their own;
+    tables is the (face_w, width) key of the base's sampling tables.
+    """
+
+    bases = []
+    for base, faces_dict in cube_sets.items():
+        try:
+            face_w = cube_face_size(base_dir, faces_dict)
+        except Exception:
+            # unreadable; process_base() reports it
+            bases.append((base, faces_dict, 0, None))
+            continue
+        w = auto_width(face_w, args.max_width) if args.width == "auto" else args.width
+        estimate = estimate_base_memory(face_w, w, args, args.band_height)
+        bases.append((base, faces_dict, estimate, (face_w, w)))
+    bases.sort(key=lambda b: (-b[2], b[0]))
+
+    # as many workers as the smallest bases allow at once
+    free = budget - PROCESS_MEMORY
+    jobs = 0
+    for _, _, estimate, _ in reversed(bases):
+        if jobs >= args.jobs or PROCESS_MEMORY + estimate > free:
+            break
+        free -= PROCESS_MEMORY + estimate
+        jobs += 1
+    args.jobs = max(1, jobs)
+
+    # what a base may use when it runs alone; main() keeps the budget
+    # above the parent and one worker, so this is positive
+    alone = budget - (1 + args.jobs) * PROCESS_MEMORY
+    planned = []
+    for base, faces_dict, estimate, size in bases:
+        band_height = args.band_height
+        tables = None
+        if size is not None:
+            face_w, w = size
+            if estimate > alone and not band_height and banding_possible(args):
+                full = estimate
+                for band_height in BAND_HEIGHTS:
+                    estimate = estimate_base_memory(face_w, w, args, band_height)
+                    if estimate <= alone:
+                        break
+                print(
+                    f"  {base}: about {full / 2**20:.0f} MB as one frame, converting in "
+                    f"bands of {band_height} rows (about {estimate / 2**20:.0f} MB)"
+                )
+            if args.output == "equirect":
+                face_w = min(face_w, equirect_face_size(w))
+            tables = (face_w, w)
+        if estimate > alone:
+            print(
+                f"  {base}: about {estimate / 2**20:.0f} MB, more than the {alone / 2**20:.0f} MB "
+                "the budget leaves a base next to the processes; it runs on its own "
+                "and may exceed the budget"
+            )
+        planned.append((base, faces_dict, estimate, band_height, tables))
+    return planned
+
+
+def run_scheduled(planned, jobs, budget, start, finish):
+    """
+    Run plan_memory()'s bases, at most jobs at once and largest first,
+    starting a base only while the estimates of the running ones plus
+    its own stay within budget. When the next base does not fit, a
+    smaller one that does is started instead; a base over budget on its
+    own runs alone.
+
+    start(base, faces_dict, band_height, tables) submits a base to the
+    worker pool and returns its future; finish(future, base, faces_dict)
+    is called for each base as it finishes.
+    """
+
+    free = budget - (1 + jobs) * PROCESS_MEMORY
+    waiting = list(planned)
+    running = {}  # future -> (base, faces_dict, estimate)
+    while waiting or running:
+        for item in list(waiting):
+            if len(running) >= jobs:
+                break
+            base, faces_dict, estimate, band_height, tables = item
+            if estimate > free and running:
+                continue
+            future = start(base, faces_dict, band_height, tables)
+            running[future] = (base, faces_dict, estimate)
+            waiting.remove(item)
+            free -= estimate
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            base, faces_dict, estimate = running.pop(future)
+            free += estimate
+            finish(future, base, faces_dict)
@@ -1,115 +1,158 @@
 import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import math
+import multiprocessing
 import os
+import queue
 import re
 import html
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import cv2
-import py360convert
-
-
-def find_cube_sets(base_dir):
+import numpy as np
+
+from cube_backends import (
+    BACKENDS, BAND_MAX_FACE, CUBE_FACE_ORDER, INTERPOLATIONS, REMAP_MAX_FACE,
+    convert_cube_to_equirect, drop_table_caches, njit, set_numba_threads,
+)
+from cube_faces import (
+    MAX_WIDTH, auto_width, cube_face_size, equirect_face_size, find_cube_sets, load_cube_faces,
+)
+from cube_scheduler import PROCESS_MEMORY, plan_memory, run_scheduled
+from cube_writer import (
+    DEFAULT_QUALITY, JPEG_SUBSAMPLING, OUTPUT_FORMATS, encode_image, encode_to_target,
+    format_supported, write_equirect_banded,
+)
+from pano_metrics import (
+    PromTextfile, RunMetrics, history_path, library_versions, machine_info, profiled, timed_stage,
+    user_dir,
+)
+
+# Conversion journal kept in the input folder, see process_base()
+JOURNAL_NAME = ".cube_to_equirect_journal.json"
+JOURNAL_VERSION = 1
+
+# Per-stage timings of the last run, see pano_metrics
+REPORT_NAME = ".cube_to_equirect_report.json"
+
+# --prom-dir series descriptions
+SCENES_HELP = "Scenes finished, by result."
+LAST_SUCCESS_HELP = "Unix time the last scene was converted."
+QUEUE_DEPTH_HELP = "Scenes waiting to be converted or converting."
+
+
+def parse_width(text):
+    """--width: a pixel count or 'auto'."""
+
+    if text.strip().lower() == "auto":
+        return "auto"
+    try:
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a width in pixels or 'auto', got {text!r}")
+
+
+def parse_size(text):
+    """Parse a byte count like 800000, 750K or 6M (K = 1024)."""
+
+    text = text.strip().upper().rstrip("B")
+    factor = 1
+    if text and text[-1] in "KMG":
+        factor = 1024 ** ("KMG".index(text[-1]) + 1)
+        text = text[:-1]
+    return int(float(text) * factor)
+
+
+# Pannellum multires output, same layout as pannellum's utils/multires/generate.py
+MULTIRES_TILE_SIZE = 512
+MULTIRES_FALLBACK_SIZE = 1024
+MULTIRES_JPEG_QUALITY = 85
+
+# our cube keys -> pannellum face letters
+PANNELLUM_FACES = {"F": "f", "B": "b", "U": "u", "D": "d", "L": "l", "R": "r"}
+
+
+def multires_levels(cube_size, tile_size=MULTIRES_TILE_SIZE):
+    """Number of pyramid levels pannellum expects for a cube face size."""
+
+    if cube_size <= tile_size:
+        return 1
+    levels = int(math.ceil(math.log(float(cube_size) / tile_size, 2))) + 1
+    if round(cube_size / 2 ** (levels - 2)) == tile_size:
+        levels -= 1  # size is an exact power-of-two multiple of the tile
+    return levels
+
+
+def write_multires_tiles(cube, out_dir, tile_size=MULTIRES_TILE_SIZE,
+                         fallback_size=MULTIRES_FALLBACK_SIZE, quality=MULTIRES_JPEG_QUALITY):
     """
-    Find all complete cube-face sets in base_dir.
+    Write a pannellum multires tile pyramid for the cube into out_dir:
 
-    Expected JPG names look like:
-      Scene431.jpg .. Scene436.jpg   -> base 'Scene43'
-      Scene321.jpg .. Scene326.jpg   -> base 'Scene32'
-      Scene211.jpg .. Scene216.jpg   -> base 'Scene21'
-      Edit01.jpg  .. Edit06.jpg      -> base 'Edit0'
-      pano131.jpg .. pano136.jpg     -> base 'pano13'
-      pano91.jpg  .. pano96.jpg      -> base 'pano9'
+      <level>/<face><row>_<col>.jpg   level 1 is the smallest
+      fallback/<face>.jpg             single images for non-WebGL browsers
+      config.json                     the "multiRes" viewer settings
 
-    Rule:
-      stem = filename without extension
-      last character 1..6 = face index
-      base = stem without last character
+    Returns the config dict that was written to config.json.
     """
 
-    sets = {}
-
-    for fname in os.listdir(base_dir):
-        if not fname.lower().endswith(".jpg"):
-            continue
-
-        stem, _ = os.path.splitext(fname)
-        if not stem:
-            continue
-
-        last = stem[-1]
-        if last not in "123456":
-            continue
-
-        face_idx = int(last)
-        base = stem[:-1]
-        if not base:
-            continue
-
-        sets.setdefault(base, {})[face_idx] = fname
-
-    complete_sets = {b: f for b, f in sets.items() if len(f) == 6}
-    return complete_sets
-
-
-def maybe_downscale_cube_faces(cube, max_dim=30000):
-    """
-    OpenCV remap has limits around 32767 for width/height.
-    If any cube face is larger than max_dim in either dimension,
-    uniformly downscale all faces so that the largest dimension is <= max_dim.
-    """
-
-    # compute maximum dimension among all faces
-    max_side = 0
-    for img in cube.values():
-        h, w = img.shape[:2]
-        max_side = max(max_side, h, w)
-
-    if max_side <= max_dim:
-        return cube  # nothing to do
-
-    scale = float(max_dim) / float(max_side)
-    print(f"  Cube faces too large (max side {max_side}), downscaling by factor {scale:.4f}")
-
-    for key, img in cube.items():
-        h, w = img.shape[:2]
-        new_w = max(1, int(w * scale))
-        new_h = max(1, int(h * scale))
-        cube[key] = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-
-    return cube
-
-
-def load_cube_faces(base_dir, faces_dict):
-    """
-    faces_dict is {1: 'Base1.jpg', ..., 6: 'Base6.jpg'}
-
-    Orientation mapping (to match your SketchUp/Three.js setup):
-
-      index 3 -> right  (+X) -> "R"
-      index 1 -> left   (-X) -> "L"
-      index 5 -> top    (+Y) -> "U"
-      index 6 -> bottom (-Y) -> "D"
-      index 4 -> +Z (was 'back' in three.js)  -> "F"
-      index 2 -> -Z (was 'front' in three.js) -> "B"
-    """
-
-    def read(fname):
-        path = os.path.join(base_dir, fname)
-        img = cv2.imread(path, cv2.IMREAD_COLOR)
-        if img is None:
-            raise FileNotFoundError(f"Could not read image: {path}")
-        return img
-
-    cube = {
-        "R": read(faces_dict[3]),
-        "L": read(faces_dict[1]),
-        "U": read(faces_dict[5]),
-        "D": read(faces_dict[6]),
-        "F": read(faces_dict[4]),
-        "B": read(faces_dict[2]),
+    cube_size = cube["F"].shape[1]
+    levels = multires_levels(cube_size, tile_size)
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+    def save(path, img):
+        if not cv2.imwrite(path, img, params):
+            raise RuntimeError(f"Failed to write tile: {path}")
+
+    os.makedirs(os.path.join(out_dir, "fallback"), exist_ok=True)
+    for level in range(1, levels + 1):
+        os.makedirs(os.path.join(out_dir, str(level)), exist_ok=True)
+
+    for key, letter in PANNELLUM_FACES.items():
+        face = cube[key]
+        size = cube_size
+        for level in range(levels, 0, -1):
+            if level < levels:
+                # each level is resized from the original face, not the previous level
+                face = cv2.resize(cube[key], (size, size), interpolation=cv2.INTER_AREA)
+            tiles = int(math.ceil(float(size) / tile_size))
+            for row in range(tiles):
+                for col in range(tiles):
+                    tile = face[row * tile_size:(row + 1) * tile_size,
+                                col * tile_size:(col + 1) * tile_size]
+                    save(os.path.join(out_dir, str(level), f"{letter}{row}_{col}.jpg"), tile)
+            size = int(size / 2)
+
+        fallback = cv2.resize(
+            cube[key], (fallback_size, fallback_size),
+            interpolation=cv2.INTER_AREA if cube_size > fallback_size else cv2.INTER_LINEAR,
+        )
+        save(os.path.join(out_dir, "fallback", f"{letter}.jpg"), fallback)
+
+    config = {
+        "type": "multires",
+        "multiRes": {
+            "path": "/%l/%s%y_%x",
+            "fallbackPath": "/fallback/%s",
+            "extension": "jpg",
+            "tileResolution": tile_size,
+            "maxLevel": levels,
+            "cubeResolution": cube_size,
+        },
     }
-
-    cube = maybe_downscale_cube_faces(cube)
-    return cube
+    with open(os.path.join(out_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return config
 
 
 def extract_title_from_content(content):
@@ -205,6 +248,889 @@ def final_cleanup(base_dir, keep_files):
     print("Cleanup complete.\n")
 
 
+def collect_base_files(base_dir, base, faces_dict):
+    """
+    Return the names of all files that belong to a base:
+    its six faces plus <base>.html / <base>.js if present.
+    """
+
+    base_related_files = set(faces_dict.values())
+    for ext in (".html", ".js"):
+        name = base + ext
+        path = os.path.join(base_dir, name)
+        if os.path.isfile(path):
+            base_related_files.add(name)
+    return base_related_files
+
+
+def conversion_params(args, width=None):
+    """
+    The conversion settings that, with the face contents, define an output.
+    width is the base's resolved width when --width is auto.
+    """
+
+    return {
+        "width": width or args.width,
+        "prefix": args.prefix,
+        "interpolation": args.interpolation,
+        "output": args.output,
+        "format": args.format,
+        "quality": args.quality,
+        "progressive": args.progressive,
+        "subsampling": args.subsampling,
+        "target_size": args.target_size,
+    }
+
+
+def conversion_key(base_dir, base, title, faces_dict, params):
+    """
+    Journal key: hash of the base name, scene title, the six face files
+    (in face order) and the conversion params.
+    """
+
+    h = hashlib.sha256()
+    h.update(json.dumps([base, title]).encode("utf-8"))
+    for idx in sorted(faces_dict):
+        h.update(file_sha256(os.path.join(base_dir, faces_dict[idx])).encode("ascii"))
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_journal(base_dir):
+    """Read the conversion journal of base_dir, or {} if there is none."""
+
+    path = os.path.join(base_dir, JOURNAL_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Could not read {JOURNAL_NAME}, starting a new one: {e}")
+        return {}
+    if data.get("version") != JOURNAL_VERSION:
+        return {}
+    return data.get("entries", {})
+
+
+def save_journal(base_dir, entries):
+    """Write the journal atomically (temp file, fsync, rename)."""
+
+    path = os.path.join(base_dir, JOURNAL_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": JOURNAL_VERSION, "entries": entries}, f, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def describe_output(path):
+    """Fingerprint of an output: size + sha256 for files, file count + size for tile folders."""
+
+    if os.path.isdir(path):
+        count = 0
+        size = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                count += 1
+                size += os.path.getsize(os.path.join(root, name))
+        return {"files": count, "size": size}
+    return {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+
+
+def outputs_match(base_dir, outputs):
+    """True if every journaled output still exists with the same fingerprint."""
+
+    for name, expected in outputs.items():
+        path = os.path.join(base_dir, name)
+        if not os.path.exists(path):
+            return False
+        if describe_output(path) != expected:
+            return False
+    return True
+
+
+def verify_image(path, width, height):
+    """Check that a written panorama decodes and has the expected size."""
+
+    # a 1/8 scale decode is enough to prove the file is complete
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        raise RuntimeError(f"Written file does not decode: {path}")
+    # JPEG rounds the reduced size up, other codecs resize and round down
+    rows, cols = img.shape[:2]
+    if abs(rows - height / 8) >= 1 or abs(cols - width / 8) >= 1:
+        raise RuntimeError(
+            f"Written file has wrong size: {path} ({img.shape[1] * 8} x {img.shape[0] * 8})"
+        )
+
+
+def verify_multires(path):
+    """Check that a written tile folder has its config and all fallback faces."""
+
+    with open(os.path.join(path, "config.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    max_level = config["multiRes"]["maxLevel"]
+    for letter in PANNELLUM_FACES.values():
+        for name in (os.path.join("fallback", f"{letter}.jpg"), os.path.join("1", f"{letter}0_0.jpg"),
+                     os.path.join(str(max_level), f"{letter}0_0.jpg")):
+            if not os.path.isfile(os.path.join(path, name)):
+                raise RuntimeError(f"Tile folder incomplete, missing {name}: {path}")
+
+
+def commit_file(tmp_path, final_path):
+    """Flush tmp_path to disk and atomically move it over final_path."""
+
+    # fsync needs a writable handle on Windows (FlushFileBuffers)
+    with open(tmp_path, "r+b") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, final_path)
+
+
+def commit_dir(tmp_dir, final_dir):
+    """Swap a finished tile folder into place, replacing any previous one."""
+
+    old_dir = None
+    if os.path.exists(final_dir):
+        old_dir = final_dir + ".old"
+        if os.path.exists(old_dir):
+            shutil.rmtree(old_dir)
+        os.replace(final_dir, old_dir)
+    os.replace(tmp_dir, final_dir)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def remove_path(path):
+    """Best-effort removal of a leftover temp file or folder."""
+
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def process_base(base_dir, base, faces_dict, args, journal=None, log=print, metrics=None):
+    """
+    Convert one cube set. Returns (keep, record):
+
+      keep   - file names cleanup must keep: the new panorama / tile folder
+               on success, or all of the base's own files on error
+      record - (key, entry) for the conversion journal, None on error
+
+    Outputs are written under temporary names, verified, then renamed
+    into place. A base whose faces and settings match a journal entry with
+    intact outputs is not converted again. Stage timings go to metrics
+    (a pano_metrics.RunMetrics) if given.
+    """
+
+    steps = process_base_steps(base_dir, base, faces_dict, args, journal, log, metrics)
+    while True:
+        result = advance_base(steps)
+        if result is not None:
+            return result
+
+
+def advance_base(steps):
+    """Run a process_base_steps() generator to its next stage; its result once done."""
+
+    try:
+        next(steps)
+        return None
+    except StopIteration as done:
+        return done.value
+
+
+def process_base_steps(base_dir, base, faces_dict, args, journal=None, log=print, metrics=None):
+    """
+    process_base() split into pipeline stages: a generator that yields
+    once the faces are read and once the panorama is converted, then
+    encodes and commits it. Its return value is process_base's result;
+    a skipped or failed base may finish at any stage.
+    """
+
+    log(f"\nProcessing base '{base}'...")
+
+    # collect files that belong to this base, so we can protect them if processing fails
+    base_related_files = collect_base_files(base_dir, base, faces_dict)
+
+    temp_paths = []
+
+    try:
+        w = args.width
+        if w == "auto":
+            face_w = cube_face_size(base_dir, faces_dict)
+            w = auto_width(face_w, args.max_width)
+            log(f"  Auto width: {w} px for {face_w} px faces")
+        h = w // 2
+        params = conversion_params(args, w)
+
+        scene_title = get_scene_title(base_dir, base)
+        safe_title = sanitize_title_for_filename(scene_title)
+        out_name = f"{args.prefix}{safe_title}{OUTPUT_FORMATS[args.format]}"
+        out_path = os.path.join(base_dir, out_name)
+
+        log(f"  Scene title: '{scene_title}' -> filename: '{out_name}'")
+
+        with timed_stage(metrics, base, "hash"):
+            key = conversion_key(base_dir, base, scene_title, faces_dict, params)
+        done = (journal or {}).get(key)
+        if done and outputs_match(base_dir, done["outputs"]):
+            names = ", ".join(f"'{n}'" for n in sorted(done["outputs"]))
+            log(f"  Already converted with the same faces and settings: {names}, skipping.")
+            return set(done["outputs"]), (key, done)
+
+        # multires tiles keep the full face resolution
+        face_size = equirect_face_size(w) if args.output == "equirect" else None
+        if args.backend == "remap":
+            # atlas_layout() splits the faces as needed, one face per atlas at most
+            cube = load_cube_faces(base_dir, faces_dict, REMAP_MAX_FACE, face_size, metrics, base, log)
+        elif args.band_height:
+            # faces are remapped one by one, so only the remap limit applies
+            cube = load_cube_faces(base_dir, faces_dict, BAND_MAX_FACE, face_size, metrics, base, log)
+        else:
+            cube = load_cube_faces(base_dir, faces_dict, face_size=face_size, metrics=metrics, item=base,
+                                   log=log)
+        yield "read"
+
+        outputs = {}
+
+        if args.output in ("multires", "both"):
+            tiles_name = f"{args.prefix}{safe_title}"
+            tmp_dir = os.path.join(base_dir, f".{tiles_name}.tmp")
+            temp_paths.append(tmp_dir)
+            remove_path(tmp_dir)
+            with timed_stage(metrics, base, "tiles") as rec:
+                config = write_multires_tiles(cube, tmp_dir)
+                rec["bytes_out"] = describe_output(tmp_dir)["size"]
+            with timed_stage(metrics, base, "verify"):
+                verify_multires(tmp_dir)
+                commit_dir(tmp_dir, os.path.join(base_dir, tiles_name))
+            outputs[tiles_name] = describe_output(os.path.join(base_dir, tiles_name))
+            log(
+                f"  Saved multires tiles: {tiles_name}/ "
+                f"({config['multiRes']['maxLevel']} levels, "
+                f"{config['multiRes']['cubeResolution']} px faces)"
+            )
+
+        if args.output in ("equirect", "both"):
+            tmp_path = os.path.join(base_dir, f".{out_name}.tmp")
+            temp_paths.append(tmp_path)
+            if args.band_height:
+                # converted and encoded together, band by band
+                write_equirect_banded(
+                    cube, w, tmp_path, args.band_height, args.quality, args.subsampling,
+                    args.backend, args.interpolation, metrics, base,
+                )
+                del cube
+                quality = args.quality
+                yield "convert"
+            else:
+                with timed_stage(metrics, base, "convert", megapixels=w * h / 1e6):
+                    equi = convert_cube_to_equirect(
+                        cube, w, args.lut_cache, args.backend, args.interpolation
+                    )
+                del cube
+                yield "convert"
+                with timed_stage(metrics, base, "encode", megapixels=w * h / 1e6) as rec:
+                    if args.target_size:
+                        data, quality = encode_to_target(
+                            equi, args.format, args.target_size, args.quality,
+                            args.progressive, args.subsampling,
+                        )
+                    else:
+                        quality = args.quality
+                        data = encode_image(equi, args.format, quality, args.progressive, args.subsampling)
+                    del equi
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                    rec["bytes_out"] = len(data)
+            with timed_stage(metrics, base, "verify"):
+                verify_image(tmp_path, w, h)
+                commit_file(tmp_path, out_path)
+            outputs[out_name] = describe_output(out_path)
+            size_mb = outputs[out_name]["size"] / (1024 * 1024)
+            log(
+                f"  Saved equirectangular panorama: {out_name} ({w} x {h}, "
+                f"{args.format} q{quality}, {size_mb:.1f} MB)"
+            )
+
+        entry = {"base": base, "params": params, "outputs": outputs}
+        return set(outputs), (key, entry)
+
+    except Exception as e:
+        for path in temp_paths:
+            remove_path(path)
+        log(f"  ERROR processing base '{base}': {e}")
+        # protect all files for this base so cleanup will not delete them
+        log("  Keeping original files for this base due to error.")
+        return base_related_files, None
+
+
+# Worker processes are spawned, as on Windows: forking after OpenCV or
+# Numba started their thread pools (e.g. during calibration) can deadlock
+WORKER_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def init_worker(threads=1):
+    """
+    Worker process setup: threads OpenCV (and Numba) threads per process,
+    by default one, as the pool itself provides the parallelism.
+    """
+
+    cv2.setNumThreads(threads)
+    set_numba_threads(threads)
+    if multiprocessing.parent_process() is not None:
+        # Ctrl+C reaches the whole process group; the parent stops the pool
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_base_in_worker(base_dir, base, faces_dict, args, journal, keep_tables=None):
+    """
+    process_base() for a worker process. Log lines are collected and
+    returned, so the parent can print them in a deterministic order.
+    With keep_tables (a (face_w, width) key), sampling tables of other
+    sizes are dropped first, as --max-memory does not budget for them.
+    """
+
+    if keep_tables is not None:
+        drop_table_caches(keep_tables)
+    lines = []
+    metrics = RunMetrics("cube_to_equirect")
+    kept, record = process_base(
+        base_dir, base, faces_dict, args, journal, log=lines.append, metrics=metrics
+    )
+    return lines, kept, record, metrics.export()
+
+
+def worker_result(future, base_dir, base, faces_dict):
+    """run_base_in_worker()'s (lines, kept, record, metrics), or an error result if the worker died."""
+
+    try:
+        return future.result()
+    except Exception as e:
+        # the worker itself died (e.g. killed or out of memory)
+        lines = [
+            f"\nProcessing base '{base}'...",
+            f"  ERROR processing base '{base}': worker failed: {e!r}",
+            "  Keeping original files for this base due to error.",
+        ]
+        return lines, collect_base_files(base_dir, base, faces_dict), None, {}
+
+
+def finish_worker_base(future, base_dir, base, faces_dict, on_result, metrics=None):
+    """Print a worker's log lines for base, merge its metrics and pass (kept, record) to on_result."""
+
+    lines, kept, record, exported = worker_result(future, base_dir, base, faces_dict)
+    if metrics is not None:
+        metrics.merge(exported)
+    for line in lines:
+        print(line)
+    on_result(kept, record)
+
+
+def run_pipeline(base_dir, cube_sets, args, journal, on_result, depth=1, metrics=None):
+    """
+    Convert the cube sets as a read -> convert -> encode pipeline, one
+    thread per stage connected by queues of at most depth bases: scene
+    N+1 decodes while scene N converts and scene N-1 encodes.
+
+    Each base runs as a process_base_steps() generator handed from stage
+    to stage, so errors stay isolated per base. Bases finish in sorted
+    order on the calling thread, which prints their log lines and passes
+    (keep, record) to on_result.
+    """
+
+    read_queue = queue.Queue(maxsize=depth)
+    convert_queue = queue.Queue(maxsize=depth)
+
+    def run_stage(items, out_queue):
+        for item in items:
+            base, faces_dict, lines, steps, result = item
+            if result is None:
+                try:
+                    result = advance_base(steps)
+                except Exception as e:
+                    # process_base_steps() handles its own errors; this is a last resort
+                    lines.append(f"  ERROR processing base '{base}': {e}")
+                    result = collect_base_files(base_dir, base, faces_dict), None
+            out_queue.put((base, faces_dict, lines, steps, result))
+        out_queue.put(None)
+
+    def new_items():
+        for base, faces_dict in sorted(cube_sets.items(), key=lambda x: x[0]):
+            lines = []
+            steps = process_base_steps(
+                base_dir, base, faces_dict, args, journal, lines.append, metrics
+            )
+            yield base, faces_dict, lines, steps, None
+
+    def queued(q):
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            yield item
+
+    stages = [
+        threading.Thread(target=run_stage, args=(new_items(), read_queue), daemon=True),
+        threading.Thread(target=run_stage, args=(queued(read_queue), convert_queue), daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+
+    # encode stage, finishing each base
+    for base, faces_dict, lines, steps, result in queued(convert_queue):
+        while result is None:
+            result = advance_base(steps)
+        for line in lines:
+            print(line)
+        on_result(*result)
+
+    for stage in stages:
+        stage.join()
+
+
+# inotify events that may complete a cube set (see FolderEvents)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+WATCH_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class FolderEvents:
+    """
+    Wake-ups on changes in a folder: inotify on Linux (through libc, no
+    extra dependency), otherwise plain polling every interval seconds.
+    """
+
+    def __init__(self, path, interval):
+        self.interval = interval
+        self.fd = None
+        if not sys.platform.startswith("linux"):
+            return
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            if libc.inotify_add_watch(fd, os.fsencode(path), WATCH_EVENTS) < 0:
+                err = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(err, "inotify_add_watch failed")
+            self.fd = fd
+        except (OSError, AttributeError) as e:
+            print(f"inotify not available ({e}), polling every {interval} s instead.")
+
+    def wait(self, timeout=None):
+        """Block until the folder changed or timeout (default the interval) passed."""
+
+        if timeout is None:
+            timeout = self.interval
+        if self.fd is None:
+            time.sleep(timeout)
+            return
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            # only the wake-up matters, drain the queued events
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def base_signature(base_dir, base, faces_dict):
+    """(name, size, mtime_ns) of a base's files; None if one vanished."""
+
+    sig = []
+    for name in sorted(collect_base_files(base_dir, base, faces_dict)):
+        try:
+            st = os.stat(os.path.join(base_dir, name))
+        except OSError:
+            return None
+        sig.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(sig)
+
+
+def remove_base_files(base_dir, base, faces_dict, kept):
+    """Watch-mode cleanup of one converted base: its own files, except kept."""
+
+    for name in sorted(collect_base_files(base_dir, base, faces_dict) - set(kept)):
+        try:
+            os.remove(os.path.join(base_dir, name))
+            print(f"  Deleted: {name}")
+        except OSError as e:
+            print(f"  Could not delete {name}: {e}")
+
+
+def watch_folder(base_dir, args, journal, record_result, metrics=None, prom=None):
+    """
+    --watch: convert cube sets as they appear in base_dir, until Ctrl+C.
+
+    A base is queued once find_cube_sets() sees all six faces and its
+    files (faces plus title .html/.js) kept the same size and mtime for
+    args.settle seconds. Bases convert on a pool of args.jobs worker
+    processes; a converted base's files are removed right away, a failed
+    one is retried only after its files change. Worker stage timings are
+    merged into metrics; prom (--prom-dir) is rewritten on every round.
+    """
+
+    events = FolderEvents(base_dir, args.poll_interval)
+    mode = "inotify" if events.fd is not None else "polling"
+    print(f"\nWatching {os.path.abspath(base_dir)} ({mode}), Ctrl+C to stop...")
+
+    seen = {}       # base -> (signature, first seen unchanged)
+    handled = {}    # base -> signature converted or failed
+    running = {}    # base -> (faces_dict, future)
+    pool = ProcessPoolExecutor(
+        max_workers=args.jobs, mp_context=WORKER_CONTEXT,
+        initializer=init_worker, initargs=(args.threads,),
+    )
+    try:
+        while True:
+            now = time.time()
+            for base, faces_dict in sorted(find_cube_sets(base_dir).items()):
+                if base in running:
+                    continue
+                sig = base_signature(base_dir, base, faces_dict)
+                if sig is None or handled.get(base) == sig:
+                    continue
+                if base not in seen or seen[base][0] != sig:
+                    # new or still changing, look again on the next scan
+                    seen[base] = (sig, now)
+                    continue
+                # unchanged since seen_since; files last written before that
+                # (e.g. present at startup) have settled for longer already
+                newest = max(m for _, _, m in sig) / 1e9
+                if now - min(seen[base][1], newest) < args.settle:
+                    continue
+                del seen[base]
+                handled[base] = sig
+                future = pool.submit(run_base_in_worker, base_dir, base, faces_dict, args, journal)
+                running[base] = (faces_dict, future)
+
+            for base, (faces_dict, future) in list(running.items()):
+                if not future.done():
+                    continue
+                del running[base]
+                lines, kept, record, exported = worker_result(future, base_dir, base, faces_dict)
+                if metrics is not None:
+                    metrics.merge(exported)
+                for line in lines:
+                    print(line)
+                record_result(kept, record)
+                if record is not None:
+                    remove_base_files(base_dir, base, faces_dict, kept)
+
+            if prom is not None:
+                prom.set("queue_depth", QUEUE_DEPTH_HELP, len(seen) + len(running))
+                prom.write()
+
+            # short naps while something settles or converts
+            events.wait(1.0 if seen or running else None)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        # queued bases are dropped; running ones end before the caller
+        # removes the shared tables they may be reading
+        if running:
+            print(f"Waiting for {len(running)} running conversion(s) to end...")
+        pool.shutdown(wait=True, cancel_futures=True)
+        events.close()
+
+
+# Per-user calibration of backend, processes and threads, see calibrate()
+CALIBRATION_VERSION = 2
+CALIBRATION_FACE = 512
+CALIBRATION_WIDTH = 2048
+CALIBRATION_REPEAT = 3
+
+_calibration_cube = None
+
+
+def calibration_path():
+    """Per-user file the calibration is cached in."""
+
+    return os.path.join(user_dir(), "cube_to_equirect_calibration.json")
+
+
+def machine_fingerprint():
+    """
+    What a calibration is valid for; a change triggers a new one. The
+    CPU and the libraries, not the OS string, which every kernel or OS
+    patch changes.
+    """
+
+    machine = machine_info()
+    return {
+        "version": CALIBRATION_VERSION,
+        "cpu": machine["cpu"],
+        "cpu_count": machine["cpu_count"],
+        "versions": library_versions(),
+    }
+
+
+def synthetic_cube(face_w):
+    """A deterministic textured cube (gradients plus noise) for calibration runs."""
+
+    rng = np.random.default_rng(face_w)
+    ramp = np.linspace(0, 200, face_w, dtype=np.float32)
+    cube = {}
+    for idx, key in enumerate(CUBE_FACE_ORDER):
+        noise = rng.integers(0, 48, (face_w, face_w), dtype=np.uint8)
+        face = np.empty((face_w, face_w, 3), dtype=np.uint8)
+        face[..., 0] = ramp[None, :].astype(np.uint8) + noise
+        face[..., 1] = ramp[:, None].astype(np.uint8) + noise
+        face[..., 2] = idx * 40
+        cube[key] = face
+    return cube
+
+
+def calibration_backends():
+    """Backends worth timing here; numba only when it is installed."""
+
+    return [b for b in BACKENDS if b != "numba" or njit is not None]
+
+
+def time_backend(cube, backend, width):
+    """Best of CALIBRATION_REPEAT conversions, after a warm-up (maps, JIT)."""
+
+    convert_cube_to_equirect(cube, width, backend=backend)
+    best = float("inf")
+    for _ in range(CALIBRATION_REPEAT):
+        start = time.perf_counter()
+        convert_cube_to_equirect(cube, width, backend=backend)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibration_task(backend):
+    """One synthetic scene in a calibration worker: convert and encode."""
+
+    global _calibration_cube
+    if _calibration_cube is None:
+        _calibration_cube = synthetic_cube(CALIBRATION_FACE)
+    equi = convert_cube_to_equirect(_calibration_cube, CALIBRATION_WIDTH, backend=backend)
+    encode_image(equi, "jpg", DEFAULT_QUALITY["jpg"])
+
+
+def calibration_combos(cpu_count):
+    """(jobs, threads) pairs to try, each using every core once."""
+
+    jobs = sorted({1, 2, 4, cpu_count // 4, cpu_count // 2, cpu_count})
+    return [(j, max(1, cpu_count // j)) for j in jobs if 1 <= j <= cpu_count]
+
+
+def time_combo(backend, jobs, threads):
+    """Seconds per scene with jobs worker processes of threads threads each."""
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, mp_context=WORKER_CONTEXT, initializer=init_worker, initargs=(threads,)
+    ) as pool:
+        # warm-up round starts the workers and builds their maps
+        list(pool.map(calibration_task, [backend] * jobs))
+        scenes = 2 * jobs
+        start = time.perf_counter()
+        list(pool.map(calibration_task, [backend] * scenes))
+        return (time.perf_counter() - start) / scenes
+
+
+def calibrate():
+    """
+    Time every available backend on a synthetic cube, then a few
+    process / thread splits of the winner (conversion plus JPEG encode,
+    as in a real run). Returns the result dict stored by save_calibration().
+    """
+
+    cube = synthetic_cube(CALIBRATION_FACE)
+    backends = {}
+    for backend in calibration_backends():
+        backends[backend] = time_backend(cube, backend, CALIBRATION_WIDTH)
+        print(f"  {backend:<14} {backends[backend] * 1000:8.1f} ms")
+    best_backend = min(backends, key=backends.get)
+
+    combos = []
+    for jobs, threads in calibration_combos(os.cpu_count() or 1):
+        seconds = time_combo(best_backend, jobs, threads)
+        combos.append({"jobs": jobs, "threads": threads, "seconds_per_scene": seconds})
+        print(f"  {jobs:>3} job(s) x {threads:>3} thread(s) {seconds * 1000:8.1f} ms/scene")
+    best = min(combos, key=lambda c: c["seconds_per_scene"])
+
+    return {
+        "fingerprint": machine_fingerprint(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backends": backends,
+        "combos": combos,
+        "backend": best_backend,
+        "jobs": best["jobs"],
+        "threads": best["threads"],
+    }
+
+
+def load_calibration():
+    """The cached calibration, or None if missing, unreadable or from another setup."""
+
+    try:
+        with open(calibration_path(), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("fingerprint") != machine_fingerprint() or data.get("backend") not in BACKENDS:
+        return None
+    return data
+
+
+def save_calibration(data):
+    path = calibration_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def get_calibration(force=False):
+    """The cached calibration, running and saving a new one when needed."""
+
+    data = None if force else load_calibration()
+    if data is None:
+        print(
+            "Running a one-off calibration for this machine (give --backend and --jobs "
+            f"to skip it), cached in {calibration_path()}..."
+        )
+        # in a child process, so its tables and test frames never stay in this one
+        with ProcessPoolExecutor(max_workers=1, mp_context=WORKER_CONTEXT) as pool:
+            data = pool.submit(calibrate).result()
+        try:
+            save_calibration(data)
+        except OSError as e:
+            print(f"  Could not save calibration: {e}")
+    return data
+
+
+# Backends that sample straight from their memory-mapped tables; the
+# others (py360convert's sampler) copy them into private arrays
+SHARED_TABLE_BACKENDS = ("numpy", "remap")
+
+
+@contextlib.contextmanager
+def shared_tables(args):
+    """
+    Around a worker pool: without --lut-cache, point args.lut_cache at a
+    scratch directory. With a backend in SHARED_TABLE_BACKENDS, sampling
+    tables then reach the workers as memory-mapped .npy files, built once
+    per (face size, width) and shared page for page instead of copied
+    into every process. The parent removes the directory once the pool
+    has shut down, also after a worker crash.
+    """
+
+    if args.jobs <= 1 or args.lut_cache or args.backend not in SHARED_TABLE_BACKENDS:
+        yield
+        return
+    scratch = tempfile.mkdtemp(prefix="cube_to_equirect_tables_")
+    args.lut_cache = scratch
+    try:
+        yield
+    finally:
+        args.lut_cache = None
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def write_run_report(metrics, args, path):
+    """Write the run's stage report to path and print its summary line."""
+
+    metrics.info.update({
+        "backend": args.backend,
+        "jobs": args.jobs,
+        "threads": args.threads,
+        "queue_depth": args.queue_depth,
+        "width": args.width,
+        "output": args.output,
+        "format": args.format,
+    })
+    try:
+        report = metrics.write_report(path)
+    except OSError as e:
+        print(f"Could not write run report {path}: {e}")
+        return
+    print(f"\n{metrics.summary(report)}")
+    print(f"Run report written to {path}")
+    if args.history:
+        metrics.append_history(args.history, report)
+
+
+def start_prom(args, metrics):
+    """The --prom-dir textfile with every series at its starting value, or None."""
+
+    if not args.prom_dir:
+        return None
+    prom = PromTextfile(args.prom_dir, metrics)
+    for result in ("converted", "skipped", "failed"):
+        prom.inc("scenes_total", SCENES_HELP, (("result", result),), 0)
+    # carried over, so a restart does not look like a stall
+    last = prom.previous("last_success_timestamp_seconds")
+    prom.set("last_success_timestamp_seconds", LAST_SUCCESS_HELP, last)
+    prom.set("queue_depth", QUEUE_DEPTH_HELP, 0)
+    prom.write()
+    return prom
+
+
+def export_result(prom, journal, record):
+    """
+    Count a finished scene in prom: converted, skipped (already in the
+    journal) or failed. Call before the journal is updated.
+    """
+
+    if prom is None:
+        return
+    if record is None:
+        result = "failed"
+    elif journal.get(record[0]) == record[1]:
+        result = "skipped"
+    else:
+        result = "converted"
+        prom.set("last_success_timestamp_seconds", LAST_SUCCESS_HELP, time.time())
+    prom.inc("scenes_total", SCENES_HELP, (("result", result),))
+
+
+def apply_calibration(args, scenes=None):
+    """
+    Fill in --backend auto and --jobs from the calibration; explicit
+    options win. --threads defaults to the cores left per process, as in
+    every calibrated split, so with fewer scenes than calibrated workers
+    the spare cores go to threads.
+    """
+
+    if args.calibrate or args.backend == "auto" or args.jobs is None:
+        calibration = get_calibration(force=args.calibrate)
+        if args.backend == "auto":
+            args.backend = calibration["backend"]
+        if args.jobs is None:
+            args.jobs = min(calibration["jobs"], scenes or calibration["jobs"])
+    if args.threads is None:
+        args.threads = max(1, (os.cpu_count() or 1) // args.jobs)
+    print(f"Using backend {args.backend}, {args.jobs} process(es) x {args.threads} thread(s).")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description=(
@@ -215,9 +1141,18 @@ def main():
     )
     parser.add_argument(
         "--width",
-        type=int,
+        type=parse_width,
         default=4096,
-        help="Output panorama width (height = width/2). Default 4096.",
+        help=(
+            "Output panorama width (height = width/2), or auto to match each "
+            "scene's face resolution (about 4x the face size). Default 4096."
+        ),
+    )
+    parser.add_argument(
+        "--max-width",
+        type=int,
+        default=None,
+        help=f"Cap for --width auto. Default {MAX_WIDTH}.",
     )
     parser.add_argument(
         "--indir",
@@ -231,18 +1166,269 @@ def main():
         default="",
         help="Optional prefix for output filenames. Default empty (no prefix).",
     )
+    parser.add_argument(
+        "--lut-cache",
+        type=str,
+        default=None,
+        help=(
+            "Optional directory for .npy sampling lookup tables, reused "
+            "across runs for the same face size and width. Default none."
+        ),
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("auto",) + BACKENDS,
+        default="auto",
+        help=(
+            "Conversion engine: py360convert's sampler, the in-tree NumPy "
+            "sampler (same output, lowest memory of the table-based engines "
+            "but slower), cv2.remap over a face atlas with fixed-point "
+            "maps, or a parallel Numba kernel (needs numba, else numpy is "
+            "used; compiled once per machine). Default auto, the fastest "
+            "one found by the calibration."
+        ),
+    )
+    parser.add_argument(
+        "--interpolation",
+        choices=sorted(INTERPOLATIONS),
+        default="bilinear",
+        help="Sampling filter; lanczos needs --backend remap. Default bilinear.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help=(
+            "Number of cube sets to convert in parallel worker processes. "
+            "Default from the calibration."
+        ),
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="OpenCV / Numba threads per process. Default the cores divided by --jobs.",
+    )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help=(
+            "Re-run the calibration that picks the backend and --jobs. It runs "
+            "once per machine (CPU and library versions) and is cached in a "
+            "per-user config file."
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "Keep running and convert cube sets as soon as all six faces are "
+            "in --indir and have stopped changing (inotify on Linux, polling "
+            "elsewhere). Stop with Ctrl+C."
+        ),
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=3.0,
+        help="--watch: seconds a set's files must stay unchanged before converting. Default 3.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=2.0,
+        help="--watch: seconds between folder scans without inotify. Default 2.",
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=1,
+        help=(
+            "With one process, scenes are read, converted and encoded as a "
+            "pipeline; this many scenes may wait between stages (each holds "
+            "its faces or panorama in memory). 0 runs scenes one after "
+            "another. Default 1."
+        ),
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=parse_size,
+        default=None,
+        help=(
+            "Memory budget for the batch, e.g. 8G. Each base's peak is estimated "
+            "from its JPEG headers; bases then run largest first, as many at "
+            "once as fit, and a base too large on its own is converted in bands "
+            "(jpg output). Replaces the --queue-depth pipeline. Default none."
+        ),
+    )
+    parser.add_argument(
+        "--output",
+        choices=("equirect", "multires", "both"),
+        default="equirect",
+        help=(
+            "What to write per scene: an equirectangular JPG, a pannellum multires "
+            "tile folder named like the JPG, or both. Default equirect."
+        ),
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(OUTPUT_FORMATS),
+        default="jpg",
+        help="Panorama file format. avif needs an OpenCV build with AVIF support. Default jpg.",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=None,
+        help=(
+            "Encoder quality 1-100. Default "
+            + ", ".join(f"{k} {v}" for k, v in DEFAULT_QUALITY.items())
+            + ". With --target-size this is the highest quality tried."
+        ),
+    )
+    parser.add_argument(
+        "--progressive",
+        action="store_true",
+        help="Write progressive JPEGs (jpg only).",
+    )
+    parser.add_argument(
+        "--subsampling",
+        choices=JPEG_SUBSAMPLING,
+        default="420",
+        help="JPEG chroma subsampling (jpg only). Default 420.",
+    )
+    parser.add_argument(
+        "--target-size",
+        type=parse_size,
+        default=None,
+        help=(
+            "Byte budget per panorama, e.g. 6M or 800K. The highest quality "
+            "whose file fits is searched for. Default none."
+        ),
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        default=None,
+        help=(
+            "JSON file for per-stage timings, throughput and peak memory of the "
+            f"run. Default {REPORT_NAME} in --indir."
+        ),
+    )
+    parser.add_argument(
+        "--history",
+        type=str,
+        default=history_path(),
+        help=(
+            "JSONL file every run's stage timings are appended to, for "
+            "'python pano_metrics.py compare'. Empty to skip. "
+            f"Default {history_path()}."
+        ),
+    )
+    parser.add_argument(
+        "--prom-dir",
+        type=str,
+        default=None,
+        help=(
+            "node_exporter textfile collector directory. cube_to_equirect.prom "
+            "there (scenes by result, stage duration histograms, bytes, queue "
+            "depth, last success time) is rewritten atomically as scenes "
+            "finish; the final cleanup keeps it when DIR is --indir. Default none."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=".",
+        default=None,
+        metavar="DIR",
+        help=(
+            "Profile the run with cProfile and tracemalloc and write the stats "
+            "into a timestamped folder in DIR (default the current directory). "
+            "Runs in one process unless --jobs is given; worker processes are "
+            "not profiled."
+        ),
+    )
+    parser.add_argument(
+        "--band-height",
+        type=int,
+        default=0,
+        help=(
+            "Build and encode the panorama in horizontal bands of this many rows, "
+            "so memory no longer grows with the full frame. Use for very large "
+            "widths. Default 0 (whole frame at once)."
+        ),
+    )
 
     args = parser.parse_args()
 
+    if args.quality is None:
+        args.quality = DEFAULT_QUALITY[args.format]
+    if not 1 <= args.quality <= 100:
+        parser.error(f"--quality must be 1-100, got {args.quality}")
+    if not format_supported(args.format):
+        parser.error(f"this OpenCV build cannot write {args.format} files")
+    if args.format != "jpg" and (args.progressive or args.subsampling != "420"):
+        parser.error("--progressive and --subsampling only apply to --format jpg")
+    if args.backend == "numba" and njit is None:
+        print("numba is not installed, using --backend numpy instead.")
+        args.backend = "numpy"
+    if args.interpolation != "bilinear" and args.backend not in ("remap", "auto"):
+        parser.error("--interpolation lanczos needs --backend remap")
+    if args.interpolation != "bilinear":
+        args.backend = "remap"
+    if args.band_height and (args.format != "jpg" or args.progressive or args.target_size):
+        parser.error("--band-height writes baseline JPEGs only, without --progressive or --target-size")
+    if args.max_memory and args.watch:
+        parser.error("--max-memory schedules batch runs, not --watch")
+    if args.max_memory and args.max_memory <= 2 * PROCESS_MEMORY:
+        parser.error(
+            f"--max-memory must be over {2 * PROCESS_MEMORY / 2**20:.0f} MB, which this "
+            "process and one worker take before converting anything"
+        )
+
+    if args.profile is None:
+        run(args)
+        return
+    if args.jobs is None:
+        args.jobs = 1
+    with profiled("cube_to_equirect", args.profile):
+        run(args)
+
+
+def run(args):
+    """main() after option parsing: convert (or --watch) args.indir."""
+
     base_dir = args.indir
     w = args.width
-    if w >= 32000:
-        print(f"Requested width {w} too large, clamping to 32000.")
-        w = 32000
-    h = w // 2
-    prefix = args.prefix
+    if w != "auto" and w >= MAX_WIDTH:
+        print(f"Requested width {w} too large, clamping to {MAX_WIDTH}.")
+        w = MAX_WIDTH
+    args.width = w
+
+    report_path = args.report or os.path.join(base_dir, REPORT_NAME)
+    metrics = RunMetrics("cube_to_equirect")
+    prom = start_prom(args, metrics)
+
+    if args.watch:
+        apply_calibration(args)
+        journal = load_journal(base_dir)
+
+        def record_watch_result(kept, record):
+            export_result(prom, journal, record)
+            if record is not None:
+                key, entry = record
+                journal[key] = entry
+                save_journal(base_dir, journal)
+
+        with shared_tables(args):
+            watch_folder(base_dir, args, journal, record_watch_result, metrics, prom)
+        drop_table_caches()
+        write_run_report(metrics, args, report_path)
+        return
 
-    cube_sets = find_cube_sets(base_dir)
+    with timed_stage(metrics, "(run)", "scan"):
+        cube_sets = find_cube_sets(base_dir)
     if not cube_sets:
         print("No complete <Base>1..6.jpg cube sets found.")
         return
@@ -251,44 +1437,88 @@ def main():
     for b in sorted(cube_sets.keys()):
         print(f"  {b}")
 
-    keep_files = set()
-
-    for base, faces_dict in sorted(cube_sets.items(), key=lambda x: x[0]):
-        print(f"\nProcessing base '{base}'...")
-
-        # collect files that belong to this base, so we can protect them if processing fails
-        base_related_files = set(faces_dict.values())
-        for ext in (".html", ".js"):
-            name = base + ext
-            path = os.path.join(base_dir, name)
-            if os.path.isfile(path):
-                base_related_files.add(name)
-
-        try:
-            scene_title = get_scene_title(base_dir, base)
-            safe_title = sanitize_title_for_filename(scene_title)
-            out_name = f"{prefix}{safe_title}.jpg"
-            out_path = os.path.join(base_dir, out_name)
-
-            print(f"  Scene title: '{scene_title}' -> filename: '{out_name}'")
-
-            cube = load_cube_faces(base_dir, faces_dict)
-
-            equi = py360convert.c2e(cubemap=cube, h=h, w=w, cube_format="dict")
-            ok = cv2.imwrite(out_path, equi)
-            if not ok:
-                raise RuntimeError(f"Failed to write output file: {out_path}")
-
-            keep_files.add(out_name)
-            print(f"  Saved equirectangular panorama: {out_name} ({w} x {h})")
-
-        except Exception as e:
-            print(f"  ERROR processing base '{base}': {e}")
-            # protect all files for this base so cleanup will not delete them
-            print("  Keeping original files for this base due to error.")
-            keep_files.update(base_related_files)
+    apply_calibration(args, len(cube_sets))
+
+    planned = None
+    if args.max_memory:
+        print(f"\nPlanning for a memory budget of {args.max_memory / 2**20:.0f} MB...")
+        planned = plan_memory(base_dir, cube_sets, args, args.max_memory)
+        print(f"Converting up to {args.jobs} base(s) at once, largest first.")
+
+    # the journal stays in the folder, cleanup must never delete it
+    keep_files = {JOURNAL_NAME, REPORT_NAME}
+    # nor the textfile, when node_exporter reads it from this folder
+    if prom is not None and os.path.realpath(args.prom_dir) == os.path.realpath(base_dir):
+        keep_files.add(os.path.basename(prom.path))
+    journal = load_journal(base_dir)
+
+    pending = len(cube_sets)
+
+    def record_result(kept, record):
+        nonlocal pending
+        export_result(prom, journal, record)
+        # journal first: faces are only deleted for committed outputs
+        keep_files.update(kept)
+        if record is not None:
+            key, entry = record
+            journal[key] = entry
+            save_journal(base_dir, journal)
+        if prom is not None:
+            pending -= 1
+            prom.set("queue_depth", QUEUE_DEPTH_HELP, pending)
+            prom.write()
+
+    if prom is not None:
+        prom.set("queue_depth", QUEUE_DEPTH_HELP, pending)
+        prom.write()
+
+    if planned is not None:
+        with shared_tables(args), ProcessPoolExecutor(
+            max_workers=args.jobs, mp_context=WORKER_CONTEXT,
+            initializer=init_worker, initargs=(args.threads,),
+        ) as pool:
+
+            def start(base, faces_dict, band_height, tables):
+                base_args = args
+                if band_height != args.band_height:
+                    base_args = argparse.Namespace(**vars(args))
+                    base_args.band_height = band_height
+                return pool.submit(
+                    run_base_in_worker, base_dir, base, faces_dict, base_args, journal, tables
+                )
+
+            def finish(future, base, faces_dict):
+                finish_worker_base(future, base_dir, base, faces_dict, record_result, metrics)
+
+            run_scheduled(planned, args.jobs, args.max_memory, start, finish)
+    elif args.jobs > 1:
+        print(f"\nConverting with {args.jobs} worker processes...")
+        with shared_tables(args), ProcessPoolExecutor(
+            max_workers=args.jobs, mp_context=WORKER_CONTEXT,
+            initializer=init_worker, initargs=(args.threads,),
+        ) as pool:
+            futures = [
+                (base, faces_dict,
+                 pool.submit(run_base_in_worker, base_dir, base, faces_dict, args, journal))
+                for base, faces_dict in sorted(cube_sets.items(), key=lambda x: x[0])
+            ]
+            # report in base order, so the log reads the same as a serial run
+            for base, faces_dict, future in futures:
+                finish_worker_base(future, base_dir, base, faces_dict, record_result, metrics)
+    elif args.queue_depth > 0:
+        init_worker(args.threads)
+        run_pipeline(
+            base_dir, cube_sets, args, journal, record_result, args.queue_depth, metrics
+        )
+    else:
+        init_worker(args.threads)
+        for base, faces_dict in sorted(cube_sets.items(), key=lambda x: x[0]):
+            record_result(*process_base(base_dir, base, faces_dict, args, journal, metrics=metrics))
+    # the tables are per (face size, width) and only reused within a run
+    drop_table_caches()
 
     final_cleanup(base_dir, keep_files)
+    write_run_report(metrics, args, report_path)
 
     print("\nAll done.")
 
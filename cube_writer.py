@@ -0,0 +1,275 @@
+"""
+Output encoding for cube_to_equirect: the --format encoders, quality
+search for --target-size, and baseline JPEGs written band by band
+straight from the cube (write_equirect_banded).
+"""
+
+import re
+
+import cv2
+import numpy as np
+
+from cube_backends import (
+    build_atlases, build_gather_plan, build_remap_maps, check_cube_faces, compute_equirect_lookup,
+    njit, pad_cube_faces, sample_cube_band, sample_cube_numba, sample_cube_numpy, sample_cube_remap,
+)
+from pano_metrics import timed_stage
+
+
+def _jpeg_segments(data):
+    """
+    Split an encoded JPEG into (header, entropy_data): header runs from SOI
+    through the SOS segment, entropy_data up to (not including) EOI.
+    """
+
+    pos = 2
+    while True:
+        if data[pos] != 0xFF:
+            raise ValueError("Malformed JPEG header")
+        marker = data[pos + 1]
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        pos += 2 + length
+        if marker == 0xDA:  # SOS
+            break
+    end = data.rindex(b"\xff\xd9")
+    return data[:pos], data[pos:end]
+
+
+def _jpeg_mcu_size(params):
+    """Return (mcu_w, mcu_h) the encoder uses for the given imencode params."""
+
+    ok, buf = cv2.imencode(".jpg", np.zeros((16, 16, 3), np.uint8), params)
+    if not ok:
+        raise RuntimeError("JPEG encoder unavailable")
+    data = buf.tobytes()
+    pos = 2
+    while pos < len(data):
+        marker = data[pos + 1]
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        if 0xC0 <= marker <= 0xC2:  # SOF0..SOF2
+            ncomp = data[pos + 9]
+            comps = data[pos + 10:pos + 10 + 3 * ncomp]
+            h_max = max(comps[i + 1] >> 4 for i in range(0, len(comps), 3))
+            v_max = max(comps[i + 1] & 0x0F for i in range(0, len(comps), 3))
+            return 8 * h_max, 8 * v_max
+        pos += 2 + length
+    raise ValueError("No SOF segment in probe JPEG")
+
+
+# Output encoders: --format -> file extension / default quality
+OUTPUT_FORMATS = {"jpg": ".jpg", "webp": ".webp", "avif": ".avif"}
+DEFAULT_QUALITY = {"jpg": 95, "webp": 90, "avif": 80}
+JPEG_SUBSAMPLING = ("420", "422", "444")
+
+# Lowest quality --target-size may go down to
+MIN_TARGET_QUALITY = 40
+
+
+def format_supported(fmt):
+    """True if this OpenCV build can write the given output format."""
+
+    return cv2.haveImageWriter("probe" + OUTPUT_FORMATS[fmt])
+
+
+def encoder_params(fmt, quality, progressive=False, subsampling="420"):
+    """cv2.imencode params for an output format."""
+
+    if fmt == "jpg":
+        params = [
+            cv2.IMWRITE_JPEG_QUALITY, quality,
+            cv2.IMWRITE_JPEG_SAMPLING_FACTOR,
+            getattr(cv2, f"IMWRITE_JPEG_SAMPLING_FACTOR_{subsampling}"),
+        ]
+        if progressive:
+            params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+        return params
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    if fmt == "avif":
+        return [cv2.IMWRITE_AVIF_QUALITY, quality]
+    raise ValueError(f"Unknown output format: {fmt}")
+
+
+def encode_image(img, fmt, quality, progressive=False, subsampling="420"):
+    """Encode img and return the file bytes."""
+
+    ok, buf = cv2.imencode(OUTPUT_FORMATS[fmt], img, encoder_params(fmt, quality, progressive, subsampling))
+    if not ok:
+        raise RuntimeError(f"Failed to encode image as {fmt}")
+    return buf.tobytes()
+
+
+def encode_to_target(img, fmt, target_size, max_quality, progressive=False, subsampling="420"):
+    """
+    Binary-search the highest quality in MIN_TARGET_QUALITY..max_quality
+    (just max_quality if that is lower) whose output fits in target_size
+    bytes. Returns (data, quality); if even the lowest quality is too big,
+    that result is returned.
+    """
+
+    floor = min(MIN_TARGET_QUALITY, max_quality)
+    lo, hi = floor, max_quality
+    best = None
+    smallest = None
+    while lo <= hi:
+        q = (lo + hi) // 2
+        data = encode_image(img, fmt, q, progressive, subsampling)
+        if len(data) <= target_size:
+            best = (data, q)
+            lo = q + 1
+        else:
+            if smallest is None or q < smallest[1]:
+                smallest = (data, q)
+            hi = q - 1
+    if best is not None:
+        return best
+    if smallest[1] > floor:
+        smallest = (encode_image(img, fmt, floor, progressive, subsampling), floor)
+    return smallest
+
+
+class BandedJpegWriter:
+    """
+    Write a baseline JPEG band by band, without holding the full frame.
+
+    Every band is encoded separately with a restart marker after each MCU
+    row. Restart markers reset the DC predictors, so the bands' entropy
+    coded data can be concatenated into a single scan once the RSTn
+    markers are renumbered. All bands share the same (default) tables.
+    Bands must be a multiple of the MCU height, except the last one.
+    """
+
+    def __init__(self, path, width, height, quality=95, subsampling="420"):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.params = encoder_params("jpg", quality, False, subsampling)
+        self.mcu_w, self.mcu_h = _jpeg_mcu_size(self.params)
+        mcus_per_row = -(-width // self.mcu_w)
+        self.params += [cv2.IMWRITE_JPEG_RST_INTERVAL, mcus_per_row]
+        self.rows_written = 0
+        self.restart_count = 0
+        self._file = open(path, "wb")
+
+    def write_band(self, band):
+        rows = band.shape[0]
+        if band.shape[1] != self.width:
+            raise ValueError(f"Band width {band.shape[1]} != {self.width}")
+        last = self.rows_written + rows >= self.height
+        if not last and rows % self.mcu_h:
+            raise ValueError(f"Band height {rows} is not a multiple of {self.mcu_h}")
+
+        ok, buf = cv2.imencode(".jpg", band, self.params)
+        if not ok:
+            raise RuntimeError(f"Failed to encode band at row {self.rows_written}")
+        header, scan = _jpeg_segments(buf.tobytes())
+
+        if self.rows_written == 0:
+            self._file.write(self._patch_height(header))
+        else:
+            # bands are separate restart intervals
+            self._write_restart()
+
+        parts = re.split(b"\xff[\xd0-\xd7]", scan)
+        self._file.write(parts[0])
+        for part in parts[1:]:
+            self._write_restart()
+            self._file.write(part)
+
+        self.rows_written += rows
+
+    def tell(self):
+        """Bytes written so far."""
+        return self._file.tell()
+
+    def close(self):
+        try:
+            if self.rows_written != self.height:
+                raise RuntimeError(
+                    f"Banded JPEG incomplete: {self.rows_written} of {self.height} rows written"
+                )
+            self._file.write(b"\xff\xd9")
+        finally:
+            self._file.close()
+
+    def abort(self):
+        """Close the file without finishing the JPEG, after an error."""
+        self._file.close()
+
+    def _write_restart(self):
+        self._file.write(bytes((0xFF, 0xD0 + self.restart_count % 8)))
+        self.restart_count += 1
+
+    def _patch_height(self, header):
+        header = bytearray(header)
+        pos = 2
+        while pos < len(header):
+            marker = header[pos + 1]
+            length = int.from_bytes(header[pos + 2:pos + 4], "big")
+            if 0xC0 <= marker <= 0xC2:
+                header[pos + 5:pos + 7] = self.height.to_bytes(2, "big")
+                break
+            pos += 2 + length
+        return bytes(header)
+
+
+def write_equirect_banded(cube, width, out_path, band_height=256, quality=95, subsampling="420",
+                          backend="py360convert", interpolation="bilinear", metrics=None, item=None):
+    """
+    Convert the cube straight into a (baseline) JPEG at out_path one band
+    of rows at a time. Peak memory is the faces plus one band, not the
+    full frame.
+
+    The numpy, remap and numba backends sample bands themselves (remap
+    with per-band maps into atlases built once); py360convert falls back to
+    per-face cv2.remap (sample_cube_band), as its sampler only works on
+    whole frames. Every backend writes the same pixels as it would
+    unbanded. With metrics, the bands add up to convert and encode stages
+    of item.
+    """
+
+    face_w = check_cube_faces(cube)
+    if backend == "remap":
+        atlases = build_atlases(cube, face_w)
+
+        def sampler(cube, face, u, v, out):
+            maps = build_remap_maps(face_w, face, u, v)
+            return sample_cube_remap(atlases, maps, out, interpolation)
+    elif backend in ("numpy", "numba"):
+        faces = pad_cube_faces(cube)
+
+        def sampler(cube, face, u, v, out):
+            return sample_cube_numpy(faces, build_gather_plan(face_w, face, u, v), out)
+    else:
+        faces = pad_cube_faces(cube)
+
+        def sampler(cube, face, u, v, out):
+            return sample_cube_band(faces, face_w, face, u, v, out)
+
+    channels = cube["F"].shape[2]
+    dtype = cube["F"].dtype
+    height = width // 2
+
+    writer = BandedJpegWriter(out_path, width, height, quality, subsampling)
+    # round the band to whole MCU rows
+    band_height = max(writer.mcu_h, band_height // writer.mcu_h * writer.mcu_h)
+    try:
+        for start in range(0, height, band_height):
+            stop = min(height, start + band_height)
+            band = np.empty((stop - start, width, channels), dtype=dtype)
+            with timed_stage(metrics, item, "convert", megapixels=band.shape[0] * width / 1e6):
+                if backend == "numba" and njit is not None:
+                    # the kernel needs no lookup
+                    sample_cube_numba(faces, band, start, height)
+                else:
+                    face, u, v = compute_equirect_lookup(face_w, width, start, stop)
+                    sampler(cube, face, u, v, band)
+            with timed_stage(metrics, item, "encode", megapixels=band.shape[0] * width / 1e6) as rec:
+                written = writer.tell()
+                writer.write_band(band)
+                rec["bytes_out"] = writer.tell() - written
+    except BaseException:
+        # keep the band's error rather than close()'s "incomplete"
+        writer.abort()
+        raise
+    writer.close()
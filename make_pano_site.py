@@ -1,19 +1,61 @@
+import argparse
+import hashlib
+import json
 import os
 import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 
+from pano_metrics import RunMetrics, history_path, profiled, timed_stage
+
+try:
+    import cv2  # only needed for the resized derivatives
+except ImportError:
+    cv2 = None
+
 # Base folder - where this script and your original images live
 BASE_DIR = Path(__file__).resolve().parent
 
 # All generated HTML + copied images will go into this folder
 OUTPUT_DIR = BASE_DIR / "docs"  # changed from "site" to "docs"
 
+# Public address of OUTPUT_DIR on GitHub Pages, used for each project's link.txt
+SITE_URL = "https://rehausprojektai.github.io/panorama-viewer/"
+
 # Image extensions to treat as panoramas
-IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".avif"}
 
 # Special filenames for the plan image (case insensitive)
 PLAN_NAMES = {"plan.jpg", "plan.jpeg", "plan.png", "plan.webp"}
 
+# Build manifest kept in the output folder for incremental rebuilds
+MANIFEST_NAME = ".site_manifest.json"
+MANIFEST_VERSION = 1
+# Separate manifest for the --projects index, which shares the top-level
+# output folder with the root gallery
+PROJECTS_MANIFEST_NAME = ".projects_manifest.json"
+
+# Index page of the root gallery (no --projects). index.html at the top of
+# the output folder is the --projects index, so the root gallery links its
+# pages from this one instead.
+ROOT_INDEX_NAME = "gallery.html"
+
+# Order of the --projects index, newest project first; add new projects at
+# the front. Projects not listed here follow in name order.
+PROJECT_ORDER = ("robandgab", "kolektyvo", "andrius")
+
+# Per-stage timings of the last build, see pano_metrics
+REPORT_NAME = ".make_pano_site_report.json"
+
+# Smaller copies of every equirect panorama, picked by the viewer per device
+TIER_WIDTHS = (2048, 4096, 8192)
+TIERS_DIR = "tiers"
+TIER_JPEG_QUALITY = 85
+# Tiny blurred image pannellum shows while the real panorama loads
+PREVIEW_WIDTH = 512
+PREVIEW_JPEG_QUALITY = 60
+
 
 VIEWER_TEMPLATE = """<!DOCTYPE html>
 <html>
@@ -55,13 +97,12 @@ VIEWER_TEMPLATE = """<!DOCTYPE html>
 </head>
 <body>
 
-  <a id="back-btn" href="index.html">Back</a>
+  <a id="back-btn" href="{index_name}">Back</a>
   <div id="panorama"></div>
 
   <script>
-    pannellum.viewer('panorama', {{
-      type: 'equirectangular',
-      panorama: '{image_filename}',
+{viewer_script}    pannellum.viewer('panorama', {{
+{viewer_config}
       autoLoad: true,
       showControls: true
     }});
@@ -71,6 +112,49 @@ VIEWER_TEMPLATE = """<!DOCTYPE html>
 </html>
 """
 
+# Pannellum source settings inserted into VIEWER_TEMPLATE
+EQUIRECT_CONFIG = """      type: 'equirectangular',
+      panorama: '{image_filename}',"""
+
+TIERED_CONFIG = """      type: 'equirectangular',
+      panorama: pickPanorama({tiers}),
+      preview: '{preview}',"""
+
+# Picks the largest tier the device can use as one texture; phones and
+# other low-core devices are capped at 4096 px.
+TIERED_SCRIPT = """    function pickPanorama(tiers) {{
+      var maxTexture = 4096;
+      try {{
+        var gl = document.createElement('canvas').getContext('webgl');
+        if (gl) {{
+          maxTexture = gl.getParameter(gl.MAX_TEXTURE_SIZE);
+        }}
+      }} catch (e) {{}}
+      if ((navigator.hardwareConcurrency || 4) <= 4) {{
+        maxTexture = Math.min(maxTexture, 4096);
+      }}
+      var pick = tiers[0];
+      for (var i = 1; i < tiers.length; i++) {{
+        if (tiers[i][0] <= maxTexture) {{
+          pick = tiers[i];
+        }}
+      }}
+      return pick[1];
+    }}
+
+"""
+
+MULTIRES_CONFIG = """      type: 'multires',
+      multiRes: {{
+        basePath: '{base_path}',
+        path: '{path}',
+        fallbackPath: '{fallback_path}',
+        extension: '{extension}',
+        tileResolution: {tile_resolution},
+        maxLevel: {max_level},
+        cubeResolution: {cube_resolution}
+      }},"""
+
 
 INDEX_HEADER = """<!DOCTYPE html>
 <html>
@@ -158,6 +242,71 @@ INDEX_FOOTER = """  </div>
 """
 
 
+# Top-level list of project galleries (--projects mode)
+PROJECTS_INDEX_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <title>Panorama projektai</title>
+  <style>
+    body {{
+      margin: 0;
+      padding: 40px 0;
+      font-family: system-ui, -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
+      background: #f6f5f4;
+      color: #1f1f1f;
+    }}
+    .container {{
+      max-width: 800px;
+      margin: 0 auto;
+      padding: 28px 24px 32px;
+      background: #ffffff;
+      border-radius: 12px;
+      box-shadow:
+        0 0 0 1px rgba(15, 15, 15, 0.06),
+        0 18px 45px rgba(15, 15, 15, 0.08);
+    }}
+    h1 {{
+      font-size: 1.5rem;
+      margin: 0 0 10px;
+    }}
+    p {{
+      margin: 0 0 14px;
+      line-height: 1.5;
+    }}
+    ul {{
+      margin: 8px 0 0;
+      padding-left: 18px;
+    }}
+    li {{
+      margin: 4px 0;
+    }}
+    a {{
+      text-decoration: none;
+      color: #2563eb;
+    }}
+    a:hover {{
+      text-decoration: underline;
+    }}
+    .slug {{
+      font-family: "SF Mono", Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace;
+      font-size: 0.9rem;
+      color: #6b6b6b;
+    }}
+  </style>
+</head>
+<body>
+  <div class="container">
+    <h1>Panorama projektai</h1>
+    <p>Pasirinkite projekta is saraso:</p>
+    <ul>
+{items}    </ul>
+  </div>
+</body>
+</html>
+"""
+
+
 def safe_name(stem: str) -> str:
     """Convert a filename stem to something safe for an HTML file name."""
     safe = []
@@ -169,8 +318,53 @@ def safe_name(stem: str) -> str:
     return "".join(safe)
 
 
+def read_multires_config(path: Path):
+    """
+    Return the "multiRes" settings if path is a tile folder written by
+    cube_to_equirect.py --output multires, else None.
+    """
+    config_path = path / "config.json"
+    if not config_path.is_file():
+        return None
+    try:
+        config = json.loads(config_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if config.get("type") != "multires" or "multiRes" not in config:
+        return None
+    return config["multiRes"]
+
+
+def viewer_config(image_filename=None, multires_dir=None, multires=None, derived=None) -> str:
+    """
+    Pannellum source settings for one scene: multires if available,
+    else the tiered equirect images (see derive_panorama), else the image.
+    """
+    if multires is not None:
+        return MULTIRES_CONFIG.format(
+            base_path=multires_dir,
+            path=multires["path"],
+            fallback_path=multires["fallbackPath"],
+            extension=multires["extension"],
+            tile_resolution=multires["tileResolution"],
+            max_level=multires["maxLevel"],
+            cube_resolution=multires["cubeResolution"],
+        )
+    if derived:
+        tiers = ", ".join(f"[{w}, '{rel}']" for w, rel in derived["tiers"])
+        return TIERED_CONFIG.format(tiers=f"[{tiers}]", preview=derived["preview"])
+    return EQUIRECT_CONFIG.format(image_filename=image_filename)
+
+
+def viewer_script(multires=None, derived=None) -> str:
+    """Extra script VIEWER_TEMPLATE needs before the viewer call, if any."""
+    if multires is None and derived:
+        return TIERED_SCRIPT.format()
+    return ""
+
+
 def clean_output_dir(path: Path) -> None:
-    """Remove everything inside OUTPUT_DIR and recreate it."""
+    """Remove everything inside the output folder and recreate it."""
     if path.exists():
         for item in path.iterdir():
             if item.is_dir():
@@ -181,57 +375,376 @@ def clean_output_dir(path: Path) -> None:
         path.mkdir(parents=True, exist_ok=True)
 
 
-def main():
-    # Clean and recreate docs/ so it only contains fresh files
-    clean_output_dir(OUTPUT_DIR)
+class OutputSync:
+    """
+    Writes files into an output folder only when they changed.
+
+    A manifest in the output folder records, for every file we wrote,
+    the source's size, mtime and sha256 (or the hash of generated text).
+    Sources whose size and mtime are unchanged are skipped without being
+    read, so a no-op rebuild only stats files. Outputs listed in the old
+    manifest but not produced again are removed by finish().
+
+    Copies and derivatives are timed into metrics (a RunMetrics, optional)
+    under the item label. Builds that share an output folder need their own
+    manifest_name, or each would remove the other's files.
+    """
+
+    def __init__(self, out_dir: Path, full_rebuild: bool = False, pool=None,
+                 metrics=None, label: str = "", manifest_name: str = MANIFEST_NAME):
+        self.out_dir = out_dir
+        self.metrics = metrics
+        self.label = label or out_dir.name
+        self.manifest_name = manifest_name
+        self.old = {} if full_rebuild else load_manifest(out_dir, manifest_name)
+        self.new = {}
+        self.written = 0
+        self.unchanged = 0
+        self.removed = 0
+        # optional thread pool for copies and derivatives; both are I/O or
+        # OpenCV bound and release the GIL
+        self.pool = pool
+        self._pending = []
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args) -> Future:
+        """Run fn on the pool, or right away without one."""
+        if self.pool is not None:
+            return self.pool.submit(fn, *args)
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def copy(self, src: Path, rel: str) -> None:
+        """Copy src to out_dir/rel unless the same content is already there."""
+        self._pending.append(self.submit(self._copy, src, rel))
+
+    def _copy(self, src: Path, rel: str) -> None:
+        dst = self.out_dir / rel
+        entry = self.source_entry(src)
+        prev = self.up_to_date(rel, entry, check_size=True)
+        if prev is not None:
+            self.record(rel, prev, written=False)
+            return
+
+        with timed_stage(self.metrics, f"{self.label}/{Path(rel).stem}", "copy",
+                         bytes_in=entry["size"], bytes_out=entry["size"]):
+            entry["hash"] = self.source_hash(src)
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src, dst)
+        self.record(rel, entry, written=True)
+
+    def source_entry(self, src: Path, **extra) -> dict:
+        """Manifest entry for an output made from src; extra describes how."""
+        st = src.stat()
+        entry = {"src": str(src), "size": st.st_size, "mtime": st.st_mtime_ns}
+        entry.update(extra)
+        return entry
+
+    def up_to_date(self, rel: str, entry: dict, check_size: bool = False):
+        """
+        Return the previous manifest entry if out_dir/rel was made from the
+        same source content the same way, else None. Unchanged size and
+        mtime skip hashing; otherwise the source is hashed and compared.
+        """
+        prev = self.old.get(rel)
+        dst = self.out_dir / rel
+        if not prev or not dst.is_file():
+            return None
+        if check_size and dst.stat().st_size != entry["size"]:
+            return None
+        recipe = {k: v for k, v in entry.items() if k not in ("src", "size", "mtime", "hash")}
+        if any(prev.get(k) != v for k, v in recipe.items()):
+            return None
+        if prev.get("src") == entry["src"] and prev.get("size") == entry["size"] \
+                and prev.get("mtime") == entry["mtime"]:
+            return prev
+        # touched or moved but maybe not changed: compare content
+        if prev.get("hash") == self.source_hash(Path(entry["src"])):
+            return dict(prev, src=entry["src"], size=entry["size"], mtime=entry["mtime"])
+        return None
+
+    def source_hash(self, src: Path) -> str:
+        """file_hash(src), computed at most once per build."""
+        key = str(src)
+        with self._lock:
+            if key in self._hashes:
+                return self._hashes[key]
+        digest = file_hash(src)
+        with self._lock:
+            self._hashes[key] = digest
+        return digest
+
+    def write_bytes(self, data: bytes, rel: str, entry: dict) -> None:
+        """Write derived data to out_dir/rel and record it with entry."""
+        dst = self.out_dir / rel
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(dst.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, dst)
+        self.record(rel, entry, written=True)
+
+    def record(self, rel: str, entry: dict, written: bool) -> None:
+        """Note out_dir/rel in the new manifest (thread safe)."""
+        with self._lock:
+            self.new[rel] = entry
+            if written:
+                self.written += 1
+            else:
+                self.unchanged += 1
+
+    def copy_tree(self, src_dir: Path, rel_dir: str) -> None:
+        """copy() every file below src_dir into out_dir/rel_dir."""
+        for src in sorted(src_dir.rglob("*")):
+            if src.is_file():
+                self.copy(src, f"{rel_dir}/{src.relative_to(src_dir).as_posix()}")
+
+    def write_text(self, text: str, rel: str) -> None:
+        """Write generated text to out_dir/rel unless it is identical."""
+        dst = self.out_dir / rel
+        data = text.encode("utf-8")
+        entry = {"src": None, "size": len(data), "hash": hashlib.sha256(data).hexdigest()}
+        prev = self.old.get(rel)
+
+        if prev and prev.get("hash") == entry["hash"] and dst.is_file() and dst.stat().st_size == len(data):
+            self.record(rel, prev, written=False)
+            return
+
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        dst.write_bytes(data)
+        self.record(rel, entry, written=True)
+
+    def finish(self) -> None:
+        """
+        Wait for pending copies, remove outputs whose sources disappeared,
+        then save the manifest.
+        """
+        for future in self._pending:
+            future.result()
+        self._pending = []
+
+        for rel in sorted(set(self.old) - set(self.new)):
+            path = self.out_dir / rel
+            if path.is_file():
+                path.unlink()
+                self.removed += 1
+            # drop folders (e.g. tile levels) left empty
+            parent = path.parent
+            while parent != self.out_dir and parent.is_dir() and not any(parent.iterdir()):
+                parent.rmdir()
+                parent = parent.parent
+        save_manifest(self.out_dir, self.new, self.manifest_name)
+
+
+def file_hash(path: Path) -> str:
+    """sha256 of a file, read in 1 MB chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(out_dir: Path, name: str = MANIFEST_NAME) -> dict:
+    """Read the output manifest, or {} if missing or unreadable."""
+    try:
+        data = json.loads((out_dir / name).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+def save_manifest(out_dir: Path, files: dict, name: str = MANIFEST_NAME) -> None:
+    """Write the output manifest atomically."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp = out_dir / (name + ".tmp")
+    tmp.write_text(
+        json.dumps({"version": MANIFEST_VERSION, "files": files}, indent=1, sort_keys=True),
+        encoding="utf-8",
+    )
+    os.replace(tmp, out_dir / name)
+
+
+def derive_panorama(sync: OutputSync, src: Path, stem: str, tier_widths) -> dict:
+    """
+    Write downscaled tiers (tiers/<stem>_<width>.jpg, only widths below
+    the source) and a blurred preview (tiers/<stem>_preview.jpg) for one
+    equirect panorama. Outputs are reused while the source content and
+    settings are unchanged.
+
+    Returns {"width", "tiers": [(width, rel), ...], "preview": rel};
+    the tiers end with the full-size image itself.
+    """
+    recipe = {
+        "tiers": list(tier_widths),
+        "tier_quality": TIER_JPEG_QUALITY,
+        "preview": [PREVIEW_WIDTH, PREVIEW_JPEG_QUALITY],
+    }
+    preview_rel = f"{TIERS_DIR}/{stem}_preview.jpg"
+    item = f"{sync.label}/{stem}"
+
+    def layout(width):
+        tiers = [(w, f"{TIERS_DIR}/{stem}_{w}.jpg") for w in sorted(tier_widths) if w < width]
+        tiers.append((width, src.name))
+        return {"width": width, "tiers": tiers, "preview": preview_rel}
+
+    # The preview entry remembers the source width, so up-to-date outputs
+    # are found without decoding anything.
+    prev = sync.up_to_date(preview_rel, sync.source_entry(src, **recipe))
+    if prev is not None and "width" in prev:
+        result = layout(prev["width"])
+        rels = [rel for _, rel in result["tiers"][:-1]]
+        current = [sync.up_to_date(rel, sync.source_entry(src, **recipe)) for rel in rels]
+        if all(entry is not None for entry in current):
+            for rel, entry in zip(rels, current):
+                sync.record(rel, entry, written=False)
+            sync.record(preview_rel, prev, written=False)
+            return result
+
+    with timed_stage(sync.metrics, item, "decode", bytes_in=src.stat().st_size) as rec:
+        img = cv2.imread(str(src), cv2.IMREAD_COLOR)
+        if img is None:
+            raise RuntimeError(f"Could not read image: {src}")
+        h, w = img.shape[:2]
+        rec["megapixels"] = w * h / 1e6
+    result = layout(w)
+    entry = dict(sync.source_entry(src, **recipe), hash=sync.source_hash(src))
+
+    def encode(image, quality):
+        with timed_stage(sync.metrics, item, "encode",
+                         megapixels=image.shape[0] * image.shape[1] / 1e6) as rec:
+            ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise RuntimeError(f"Could not encode derivative of {src}")
+            rec["bytes_out"] = len(buf)
+        return buf.tobytes()
+
+    for tier_w, rel in result["tiers"][:-1]:
+        tier_h = max(1, round(h * tier_w / w))
+        with timed_stage(sync.metrics, item, "downscale", megapixels=w * h / 1e6):
+            small = cv2.resize(img, (tier_w, tier_h), interpolation=cv2.INTER_AREA)
+        sync.write_bytes(encode(small, TIER_JPEG_QUALITY), rel, entry)
+
+    preview_h = max(1, round(h * PREVIEW_WIDTH / w))
+    with timed_stage(sync.metrics, item, "downscale", megapixels=w * h / 1e6):
+        preview = cv2.resize(img, (PREVIEW_WIDTH, preview_h), interpolation=cv2.INTER_AREA)
+        preview = cv2.GaussianBlur(preview, (0, 0), 2)
+    sync.write_bytes(encode(preview, PREVIEW_JPEG_QUALITY), preview_rel, dict(entry, width=w))
+    return result
+
+
+def build_gallery(src_dir: Path, out_dir: Path, full_rebuild: bool = False,
+                  link_url=None, pool=None, tier_widths=TIER_WIDTHS,
+                  metrics=None, index_name: str = "index.html") -> OutputSync:
+    """
+    Build one panorama gallery (viewer pages + index_name) from the images
+    and multires tile folders in src_dir into out_dir, incrementally.
+    If link_url is given it is written to link.txt. Equirect panoramas get
+    resized tiers and a preview (see derive_panorama) unless tier_widths
+    is empty or OpenCV is not installed. Stage timings go to metrics.
+    """
+    if full_rebuild:
+        # Clean and recreate the output folder so it only contains fresh files
+        clean_output_dir(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sync = OutputSync(out_dir, full_rebuild, pool, metrics)
+    if index_name != "index.html":
+        # earlier builds wrote this gallery's index as index.html, which
+        # may be the --projects index by now; it is not ours to remove
+        sync.old.pop("index.html", None)
+
+    if link_url:
+        sync.write_text(link_url, "link.txt")
 
     plan_image_src = None
     plan_image_dst_name = None
     images_src = []
-
-    # Scan for images and separate plan image from panoramas
-    for entry in BASE_DIR.iterdir():
-        if entry.is_file() and entry.suffix.lower() in IMAGE_EXTS:
-            lower_name = entry.name.lower()
-            if lower_name in PLAN_NAMES:
-                plan_image_src = entry
-            else:
-                images_src.append(entry)
-
-    images_src.sort(key=lambda p: p.name.lower())
-
-    if not images_src and not plan_image_src:
-        print("No panorama or plan images found.")
-        return
+    multires_src = {}
+
+    # Scan for images and multires tile folders, separate plan image from panoramas
+    with timed_stage(metrics, sync.label, "scan"):
+        for entry in src_dir.iterdir():
+            if entry.is_file() and entry.suffix.lower() in IMAGE_EXTS:
+                lower_name = entry.name.lower()
+                if lower_name in PLAN_NAMES:
+                    plan_image_src = entry
+                else:
+                    images_src.append(entry)
+            elif entry.is_dir():
+                multires = read_multires_config(entry)
+                if multires is not None:
+                    multires_src[entry.name] = (entry, multires)
+
+    # A scene is either a single image, a tile folder, or both (same name);
+    # with both, the viewer uses the tiles and the image stays as a download.
+    scenes = {p.stem: p for p in images_src}
+    for name in multires_src:
+        scenes.setdefault(name, None)
+
+    if not scenes and not plan_image_src:
+        print(f"No panorama or plan images found in {src_dir}.")
+        sync.finish()
+        return sync
 
     index_items = []
 
-    # Copy plan image into docs/ if present
+    # Copy plan image into the output folder if present
     if plan_image_src:
         plan_image_dst_name = plan_image_src.name
-        shutil.copy2(plan_image_src, OUTPUT_DIR / plan_image_dst_name)
-
-    # Copy panorama images into docs/ and create viewer pages
-    for img_src in images_src:
-        stem = img_src.stem
+        sync.copy(plan_image_src, plan_image_dst_name)
+
+    if tier_widths and cv2 is None:
+        print("OpenCV (cv2) not installed, skipping resized panorama tiers.")
+        tier_widths = ()
+
+    # Copy panorama images / tiles and start their derivatives
+    derived_futures = {}
+    multires_scenes = {}
+    for stem in sorted(scenes, key=str.lower):
+        img_src = scenes[stem]
+        if img_src is not None:
+            # Destination image name (keep original name)
+            sync.copy(img_src, img_src.name)
+
+        if stem in multires_src:
+            tiles_src, multires_scenes[stem] = multires_src[stem]
+            sync.copy_tree(tiles_src, tiles_src.name)
+        elif img_src is not None and tier_widths:
+            derived_futures[stem] = sync.submit(derive_panorama, sync, img_src, stem, tier_widths)
+
+    # Create viewer pages
+    for stem in sorted(scenes, key=str.lower):
+        img_src = scenes[stem]
         safe_stem = safe_name(stem)
         viewer_filename = f"view_{safe_stem}.html"
-
-        # Destination image name (keep original name)
-        img_dst_name = img_src.name
-        shutil.copy2(img_src, OUTPUT_DIR / img_dst_name)
-
-        html = VIEWER_TEMPLATE.format(
-            title=stem,
-            image_filename=img_dst_name,
-        )
-
-        viewer_path = OUTPUT_DIR / viewer_filename
-        viewer_path.write_text(html, encoding="utf-8")
+        img_dst_name = img_src.name if img_src is not None else None
+        multires = multires_scenes.get(stem)
+
+        derived = None
+        if stem in derived_futures:
+            try:
+                derived = derived_futures[stem].result()
+            except Exception as e:
+                print(f"Could not create tiers for {img_src.name}, using the original only: {e}")
+
+        with timed_stage(metrics, sync.label, "render"):
+            html = VIEWER_TEMPLATE.format(
+                title=stem,
+                index_name=index_name,
+                viewer_script=viewer_script(multires, derived),
+                viewer_config=viewer_config(img_dst_name, stem, multires, derived),
+            )
+            sync.write_text(html, viewer_filename)
 
         index_items.append((stem, viewer_filename))
 
-    # Build index.html inside docs/
+    # Build the index page
     index_html_parts = [INDEX_HEADER]
 
     # Panorama list first, with Lithuanian hint text
@@ -258,15 +771,200 @@ def main():
 
     index_html_parts.append(INDEX_FOOTER)
 
-    index_path = OUTPUT_DIR / "index.html"
-    index_path.write_text("".join(index_html_parts), encoding="utf-8")
+    with timed_stage(metrics, sync.label, "render"):
+        sync.write_text("".join(index_html_parts), index_name)
+    sync.finish()
+    return sync
+
+
+def find_projects(src_root: Path) -> list:
+    """
+    Project folders below src_root: every non-hidden subfolder holding at
+    least one image or multires tile folder, in PROJECT_ORDER and then by
+    name. The order is explicit because folder mtimes are not: a checkout
+    gives them all the same time, and adding files changes them.
+    """
+    projects = []
+    for entry in src_root.iterdir():
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        has_content = any(
+            (p.is_file() and p.suffix.lower() in IMAGE_EXTS)
+            or (p.is_dir() and read_multires_config(p) is not None)
+            for p in entry.iterdir()
+        )
+        if has_content:
+            projects.append(entry)
+    rank = {name: i for i, name in enumerate(PROJECT_ORDER)}
+    projects.sort(key=lambda p: (rank.get(p.name, len(rank)), p.name.lower()))
+    return projects
+
+
+def build_projects(src_root: Path, out_root: Path, full_rebuild: bool = False,
+                   workers: int = 4, tier_widths=TIER_WIDTHS, metrics=None) -> dict:
+    """
+    Build docs/<project>/ for every project folder in src_root, plus the
+    top-level project index. Galleries are built concurrently and share
+    one thread pool for their copies and derivatives.
+    Returns {project: OutputSync}.
+    """
+    projects = find_projects(src_root)
+    out_root.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool, \
+            ThreadPoolExecutor(max_workers=workers) as gallery_pool:
+        futures = {
+            p.name: gallery_pool.submit(
+                build_gallery,
+                p,
+                out_root / p.name,
+                full_rebuild,
+                f"{SITE_URL}{p.name}/",
+                pool,
+                tier_widths,
+                metrics,
+            )
+            for p in projects
+        }
+        for name, future in futures.items():
+            results[name] = future.result()
+
+    # Remove galleries we built earlier whose project folder is gone
+    names = {p.name for p in projects}
+    for entry in out_root.iterdir():
+        if entry.is_dir() and entry.name not in names and (entry / MANIFEST_NAME).is_file():
+            shutil.rmtree(entry)
+            print(f"Removed gallery of deleted project: {entry.name}")
+
+    items = "".join(
+        f"      <li><a href=\"{p.name}/index.html\">{p.name}</a></li>\n" for p in projects
+    )
+    sync = OutputSync(out_root, metrics=metrics, label="(index)",
+                      manifest_name=PROJECTS_MANIFEST_NAME)
+    with timed_stage(metrics, sync.label, "render"):
+        sync.write_text(PROJECTS_INDEX_TEMPLATE.format(items=items), "index.html")
+    sync.finish()
+    return results
+
 
-    print("Generated site in:", OUTPUT_DIR)
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the pannellum panorama site from the images next to this script."
+    )
+    parser.add_argument(
+        "--clean",
+        action="store_true",
+        help="Wipe the output folder(s) and rebuild everything instead of only changed files.",
+    )
+    parser.add_argument(
+        "--projects",
+        type=Path,
+        default=None,
+        help=(
+            "Folder with one subfolder per project. Builds <out>/<project>/ for each "
+            "of them, their link.txt and the top-level project index."
+        ),
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        default=OUTPUT_DIR,
+        help=f"Output folder. Default {OUTPUT_DIR.name}/ next to this script.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Threads for copying files and resizing tiers (and galleries in --projects mode). Default 4.",
+    )
+    parser.add_argument(
+        "--tiers",
+        type=str,
+        default=",".join(str(w) for w in TIER_WIDTHS),
+        help=(
+            "Comma separated widths of the resized panorama copies the viewer chooses "
+            "from; empty to serve the original only. "
+            f"Default {','.join(str(w) for w in TIER_WIDTHS)}."
+        ),
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=BASE_DIR / REPORT_NAME,
+        help=(
+            "JSON file for per-stage timings, throughput and peak memory of the "
+            f"build. Default {REPORT_NAME} next to this script."
+        ),
+    )
+    parser.add_argument(
+        "--history",
+        type=str,
+        default=history_path(),
+        help=(
+            "JSONL file every build's stage timings are appended to, for "
+            "'python pano_metrics.py compare'. Empty to skip. "
+            f"Default {history_path()}."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        nargs="?",
+        const=Path("."),
+        default=None,
+        metavar="DIR",
+        help=(
+            "Profile the build with cProfile and tracemalloc and write the stats "
+            "into a timestamped folder in DIR (default the current directory)."
+        ),
+    )
+    args = parser.parse_args()
+
+    if args.profile is None:
+        build(args)
+        return
+    with profiled("make_pano_site", args.profile):
+        build(args)
+
+
+def build(args) -> None:
+    """main() after option parsing: build the site into args.out."""
+
+    out_dir = args.out.resolve()
+    tier_widths = tuple(int(w) for w in args.tiers.split(",") if w.strip())
+    metrics = RunMetrics("make_pano_site", work_stage="decode")
+    metrics.info.update({"workers": args.workers, "tiers": list(tier_widths), "clean": args.clean})
+
+    if args.projects:
+        results = build_projects(
+            args.projects.resolve(), out_dir, args.clean, args.workers, tier_widths, metrics
+        )
+        print("Generated project galleries in:", out_dir)
+        for name, sync in results.items():
+            print(f"  {name}: {sync.written} written, {sync.unchanged} unchanged, {sync.removed} removed")
+    else:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            sync = build_gallery(
+                BASE_DIR, out_dir, args.clean, pool=pool, tier_widths=tier_widths, metrics=metrics,
+                index_name=ROOT_INDEX_NAME,
+            )
+        print("Generated site in:", out_dir)
+        print(f"  {sync.written} written, {sync.unchanged} unchanged, {sync.removed} removed")
+    try:
+        report = metrics.write_report(args.report)
+    except OSError as e:
+        print(f"Could not write build report {args.report}: {e}")
+    else:
+        print(metrics.summary(report))
+        if args.history:
+            metrics.append_history(args.history, report)
     print()
     print("To view locally:")
     print(f"1. cd {BASE_DIR}")
     print("2. python -m http.server 8000")
-    print("3. Open http://localhost:8000/docs/index.html in your browser")
+    index_name = "index.html" if args.projects else ROOT_INDEX_NAME
+    print(f"3. Open http://localhost:8000/{out_dir.name}/{index_name} in your browser")
     print()
     print("On GitHub Pages, set Source = main branch, Folder = /docs.")
 
@@ -0,0 +1,714 @@
+"""
+Per-stage timing, throughput and memory figures for the panorama scripts.
+
+A RunMetrics collects, per item (a cube base, a panorama, ...), the time
+spent in each stage together with bytes in / out and megapixels, and at
+the end of a run writes them as a JSON report plus a one-line summary:
+
+    metrics = RunMetrics("cube_to_equirect")
+    with timed_stage(metrics, "Scene4", "encode") as rec:
+        data = encode(...)
+        rec["bytes_out"] = len(data)
+    metrics.write_report("report.json")
+    print(metrics.summary())
+
+Every run is also appended to a per-user JSONL history, which
+
+    python pano_metrics.py compare
+
+checks for stages that got slower than in the previous runs.
+"""
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+REPORT_VERSION = 1
+
+HISTORY_VERSION = 1
+HISTORY_NAME = "run_history.jsonl"
+# Library versions kept with each history entry, when loaded
+HISTORY_MODULES = ("cv2", "numpy", "py360convert", "numba")
+
+# Upper bounds of the Prometheus stage duration buckets, in seconds
+PROM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# From Python 3.12 cProfile sits on sys.monitoring: one profiler sees
+# every thread (on a single call stack), and a second one refuses to start
+PROFILE_ALL_THREADS = sys.version_info >= (3, 12)
+
+# Rows in the --profile text summaries
+PROFILE_TOP = 60
+TRACEMALLOC_TOP = 40
+
+# Counters summed per stage
+COUNTERS = ("seconds", "calls", "bytes_in", "bytes_out", "megapixels")
+
+
+def _windows_peak_rss_mb():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize / (1024 * 1024)
+
+
+def user_dir():
+    """Per-user folder for the panorama scripts' calibration and history."""
+
+    if os.name == "nt":
+        root = os.environ.get("APPDATA") or os.path.expanduser("~")
+    else:
+        root = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(root, "panorama-viewer")
+
+
+def history_path():
+    return os.path.join(user_dir(), HISTORY_NAME)
+
+
+def peak_rss_mb(children=False):
+    """
+    Peak resident set size so far in MB, of this process or (children=True)
+    of its largest finished child process. None where unknown.
+    """
+
+    if resource is None:
+        if children or sys.platform != "win32":
+            return None
+        try:
+            return _windows_peak_rss_mb()
+        except Exception:
+            return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def cpu_model():
+    """The CPU's model name, e.g. from /proc/cpuinfo; the architecture where unknown."""
+
+    try:
+        if sys.platform.startswith("linux"):
+            with open("/proc/cpuinfo", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key.strip() in ("model name", "Hardware", "cpu model") and value.strip():
+                        return value.strip()
+        elif sys.platform == "darwin":
+            out = subprocess.run(
+                ["sysctl", "-n", "machdep.cpu.brand_string"], capture_output=True, text=True
+            ).stdout.strip()
+            if out:
+                return out
+        elif platform.processor():
+            return platform.processor()
+    except OSError:
+        pass
+    return platform.machine()
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu": cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def with_rates(stage):
+    """A stage's counters plus MP/s where megapixels were recorded."""
+
+    stage = dict(stage)
+    if stage["megapixels"] and stage["seconds"] > 0:
+        stage["mp_per_s"] = round(stage["megapixels"] / stage["seconds"], 2)
+    return stage
+
+
+class RunMetrics:
+    """
+    Stage timings of one run, safe to record from several threads.
+    work_stage is the stage whose megapixels count as the run's work.
+    """
+
+    def __init__(self, tool, work_stage="convert"):
+        self.tool = tool
+        self.work_stage = work_stage
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.items = {}  # item -> {stage: counters}
+        self.durations = {}  # stage -> histogram, one observation per finished stage
+        self.info = {}   # run-level facts for the report, e.g. settings
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, item, name, **counts):
+        """
+        Time the with-block as stage name of item. Yields a dict whose
+        bytes_in / bytes_out / megapixels the block may fill in.
+        """
+
+        rec = dict(counts)
+        start = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            self.add(item, name, time.perf_counter() - start, **rec)
+
+    def add(self, item, name, seconds, bytes_in=0, bytes_out=0, megapixels=0.0):
+        rss = peak_rss_mb()
+        with self._lock:
+            stage = self._stage(item, name)
+            stage["seconds"] += seconds
+            stage["calls"] += 1
+            stage["bytes_in"] += bytes_in
+            stage["bytes_out"] += bytes_out
+            stage["megapixels"] += megapixels
+            if rss is not None:
+                stage["peak_rss_mb"] = round(max(stage["peak_rss_mb"] or 0, rss), 1)
+            histogram = self._histogram(name)
+            bucket = next((i for i, bound in enumerate(PROM_BUCKETS) if seconds <= bound),
+                          len(PROM_BUCKETS))
+            histogram["buckets"][bucket] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+
+    def export(self):
+        """The items and durations as plain data, for merge() in another process."""
+
+        with self._lock:
+            return {"items": self.items, "durations": self.durations}
+
+    def merge(self, exported):
+        """Add what export() returned for another RunMetrics, e.g. in a worker process."""
+
+        with self._lock:
+            for name, other in exported.get("durations", {}).items():
+                histogram = self._histogram(name)
+                histogram["buckets"] = [a + b for a, b in zip(histogram["buckets"], other["buckets"])]
+                histogram["count"] += other["count"]
+                histogram["sum"] += other["sum"]
+            for item, stages in exported.get("items", {}).items():
+                for name, other in stages.items():
+                    stage = self._stage(item, name)
+                    for k in COUNTERS:
+                        stage[k] += other[k]
+                    if other.get("peak_rss_mb") is not None:
+                        stage["peak_rss_mb"] = max(stage["peak_rss_mb"] or 0, other["peak_rss_mb"])
+
+    def _histogram(self, name):
+        # per bucket: observations above the previous bound, the last one unbounded
+        return self.durations.setdefault(
+            name, {"buckets": [0] * (len(PROM_BUCKETS) + 1), "count": 0, "sum": 0.0}
+        )
+
+    def _stage(self, item, name):
+        return self.items.setdefault(item, {}).setdefault(
+            name, {"seconds": 0.0, "calls": 0, "bytes_in": 0, "bytes_out": 0,
+                   "megapixels": 0.0, "peak_rss_mb": None}
+        )
+
+    def stage_totals(self):
+        """{stage: counters summed over all items}, in first-seen order."""
+
+        totals = {}
+        with self._lock:
+            for stages in self.items.values():
+                for name, stage in stages.items():
+                    total = totals.setdefault(name, {k: 0 for k in COUNTERS})
+                    for k in COUNTERS:
+                        total[k] += stage[k]
+        return {name: with_rates(total) for name, total in totals.items()}
+
+    def report(self):
+        with self._lock:
+            items = {
+                item: {name: with_rates(stage) for name, stage in stages.items()}
+                for item, stages in self.items.items()
+            }
+        return {
+            "version": REPORT_VERSION,
+            "tool": self.tool,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": round(time.perf_counter() - self._start, 3),
+            "machine": machine_info(),
+            "peak_rss_mb": {"process": peak_rss_mb(), "children": peak_rss_mb(children=True)},
+            "info": self.info,
+            "stages": self.stage_totals(),
+            "items": items,
+        }
+
+    def write_report(self, path):
+        """Write report() as JSON to path (atomically); returns the report."""
+
+        report = self.report()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp, path)
+        return report
+
+    def summary(self, report=None):
+        """One line: wall time, the stages by share of stage time, bytes and peak RSS."""
+
+        report = report or self.report()
+        stages = report["stages"]
+        busy = sum(s["seconds"] for s in stages.values()) or 1.0
+        parts = [f"{self.tool}: {real_item_count(report)} item(s) in {report['wall_seconds']:.1f} s"]
+        for name, stage in sorted(stages.items(), key=lambda kv: -kv[1]["seconds"]):
+            text = f"{name} {stage['seconds']:.2f} s ({100 * stage['seconds'] / busy:.0f}%"
+            if "mp_per_s" in stage:
+                text += f", {stage['mp_per_s']:.0f} MP/s"
+            parts.append(text + ")")
+        bytes_in = sum(s["bytes_in"] for s in stages.values())
+        bytes_out = sum(s["bytes_out"] for s in stages.values())
+        parts.append(f"{bytes_in / 1e6:.1f} MB in, {bytes_out / 1e6:.1f} MB out")
+        peaks = [p for p in report["peak_rss_mb"].values() if p is not None]
+        if peaks:
+            parts.append(f"peak RSS {max(peaks):.0f} MB")
+        return " | ".join(parts)
+
+    def history_entry(self, report=None):
+        """
+        The run as one history line: counts, wall time, per-stage
+        counters, peak memory, machine and library versions.
+        """
+
+        report = report or self.report()
+        stages = report["stages"]
+        peaks = [p for p in report["peak_rss_mb"].values() if p is not None]
+        return {
+            "version": HISTORY_VERSION,
+            "tool": self.tool,
+            "started": report["started"],
+            "wall_seconds": report["wall_seconds"],
+            "items": real_item_count(report),
+            "megapixels": round(stages.get(self.work_stage, {}).get("megapixels", 0.0), 3),
+            "peak_rss_mb": round(max(peaks), 1) if peaks else None,
+            "machine": report["machine"],
+            "versions": library_versions(),
+            "info": report["info"],
+            "stages": {
+                name: {k: stage[k] for k in ("seconds", "calls", "megapixels")}
+                for name, stage in stages.items()
+            },
+        }
+
+    def append_history(self, path, report=None):
+        """Append history_entry() to the JSONL file path; False if that failed."""
+
+        line = json.dumps(self.history_entry(report), sort_keys=True)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"Could not append to run history {path}: {e}")
+            return False
+        return True
+
+
+class PromTextfile:
+    """
+    A <tool>.prom file for node_exporter's textfile collector: the
+    counters and gauges set here, plus from metrics the stage durations
+    (a histogram with one observation per finished stage) and the bytes
+    read and written; both only grow while metrics lives.
+
+    write() replaces the file atomically, so the collector never sees
+    half a file.
+    """
+
+    def __init__(self, directory, metrics):
+        self.path = os.path.join(directory, f"{metrics.tool}.prom")
+        self.metrics = metrics
+        self.prefix = metrics.tool
+        self.families = {}  # name -> (type, help, {labels: value})
+
+    def inc(self, name, help, labels=(), value=1):
+        """Add value to counter name; labels are (key, value) pairs."""
+
+        samples = self._family(name, "counter", help)
+        samples[tuple(labels)] = samples.get(tuple(labels), 0) + value
+
+    def set(self, name, help, value, labels=()):
+        self._family(name, "gauge", help)[tuple(labels)] = value
+
+    def previous(self, name, default=0.0):
+        """Value of an unlabelled sample in the file written last time, e.g. by an earlier run."""
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    key, _, value = line.strip().partition(" ")
+                    if key == f"{self.prefix}_{name}":
+                        return float(value)
+        except (OSError, ValueError):
+            pass
+        return default
+
+    def _family(self, name, kind, help):
+        return self.families.setdefault(name, (kind, help, {}))[2]
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help):
+            lines.append(f"# HELP {self.prefix}_{name} {help}")
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        def sample(name, labels, value):
+            text = ",".join(f'{k}="{v}"' for k, v in labels)
+            value = int(value) if float(value).is_integer() else round(value, 6)
+            lines.append(f"{self.prefix}_{name}{{{text}}} {value}" if text
+                         else f"{self.prefix}_{name} {value}")
+
+        for name, (kind, help, samples) in self.families.items():
+            family(name, kind, help)
+            for labels, value in samples.items():
+                sample(name, labels, value)
+
+        with self.metrics._lock:
+            durations = {stage: dict(histogram) for stage, histogram in self.metrics.durations.items()}
+        totals = self.metrics.stage_totals()
+
+        family("stage_duration_seconds", "histogram", "Duration of each finished stage.")
+        for stage, histogram in durations.items():
+            seen = 0
+            for bound, count in zip(PROM_BUCKETS, histogram["buckets"]):
+                seen += count
+                sample("stage_duration_seconds_bucket", (("stage", stage), ("le", f"{bound:g}")), seen)
+            sample("stage_duration_seconds_bucket", (("stage", stage), ("le", "+Inf")),
+                   histogram["count"])
+            sample("stage_duration_seconds_sum", (("stage", stage),), histogram["sum"])
+            sample("stage_duration_seconds_count", (("stage", stage),), histogram["count"])
+        for name, key, help in (("bytes_read_total", "bytes_in", "Bytes read."),
+                                ("bytes_written_total", "bytes_out", "Bytes written.")):
+            family(name, "counter", help)
+            sample(name, (), sum(t[key] for t in totals.values()))
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Rewrite the file; a failure is printed, not raised."""
+
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not write {self.path}: {e}")
+
+
+def library_versions():
+    """Versions of the HISTORY_MODULES this process has loaded."""
+
+    versions = {}
+    for name in HISTORY_MODULES:
+        module = sys.modules.get(name)
+        if module is not None:
+            versions[name] = getattr(module, "__version__", "unknown")
+    return versions
+
+
+def real_item_count(report):
+    """Items in report, leaving out "(run)" and the like, which hold run-wide stages."""
+    return sum(1 for item in report["items"] if not item.startswith("("))
+
+
+@contextmanager
+def timed_stage(metrics, item, name, **counts):
+    """metrics.stage(item, name), or a no-op block when metrics is None."""
+
+    if metrics is None:
+        yield dict(counts)
+        return
+    with metrics.stage(item, name, **counts) as rec:
+        yield rec
+
+
+@contextmanager
+def profiled(tool, root="."):
+    """
+    --profile: run the with-block under cProfile and tracemalloc and write
+    into <root>/profile_<tool>_<timestamp>/:
+
+      profile.pstats  the raw profile, for pstats or snakeviz
+      profile.txt     top functions by cumulative and by own time
+      memory.txt      tracemalloc: top allocation sites, end vs start
+
+    Threads started inside the block are profiled too (before Python 3.12
+    each by a profiler of its own, merged into the result); other
+    processes are not. Yields the folder.
+    """
+
+    out_dir = os.path.join(root, time.strftime(f"profile_{tool}_%Y%m%d-%H%M%S"))
+    os.makedirs(out_dir, exist_ok=True)
+
+    thread_profiles = []
+    lock = threading.Lock()
+
+    def start_thread_profile(frame, event, arg):
+        # first event in a new thread: hand it over to its own profiler
+        profile = cProfile.Profile()
+        with lock:
+            thread_profiles.append(profile)
+        profile.enable()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    profile = cProfile.Profile()
+    if not PROFILE_ALL_THREADS:
+        threading.setprofile(start_thread_profile)
+    profile.enable()
+    try:
+        yield out_dir
+    finally:
+        profile.disable()
+        if not PROFILE_ALL_THREADS:
+            threading.setprofile(None)
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        write_profile(out_dir, profile, thread_profiles, before, after, peak)
+        print(f"Profile written to {out_dir}")
+
+
+def write_profile(out_dir, profile, thread_profiles, before, after, peak):
+    """The files of profiled(), see there."""
+
+    profiles = [profile] + [p for p in thread_profiles if p.getstats()]
+    stats = pstats.Stats(*profiles)
+    stats.dump_stats(os.path.join(out_dir, "profile.pstats"))
+
+    text = io.StringIO()
+    stats.stream = text
+    if PROFILE_ALL_THREADS:
+        print("All threads in one profile; own times hold, cumulative times "
+              "across threads are approximate\n", file=text)
+    else:
+        print(f"{len(profiles) - 1} profiled thread(s) besides the main one\n", file=text)
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+    stats.sort_stats("tottime").print_stats(PROFILE_TOP)
+    with open(os.path.join(out_dir, "profile.txt"), "w", encoding="utf-8") as f:
+        f.write(text.getvalue())
+
+    with open(os.path.join(out_dir, "memory.txt"), "w", encoding="utf-8") as f:
+        f.write(f"Peak traced memory: {peak / (1024 * 1024):.1f} MB\n")
+        f.write(f"Top {TRACEMALLOC_TOP} allocation sites, end of run vs start:\n\n")
+        for diff in after.compare_to(before, "lineno")[:TRACEMALLOC_TOP]:
+            f.write(f"{diff}\n")
+
+
+def load_history(path):
+    """The history entries in path, oldest first; unreadable lines are skipped."""
+
+    entries = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and entry.get("version") == HISTORY_VERSION:
+                    entries.append(entry)
+    except OSError:
+        pass
+    return entries
+
+
+def comparable(a, b):
+    """Same tool, machine and settings, so stage times can be compared."""
+
+    keys = ("platform", "machine", "cpu_count")
+    return (
+        a["tool"] == b["tool"]
+        and all(a["machine"].get(k) == b["machine"].get(k) for k in keys)
+        and a["info"] == b["info"]
+    )
+
+
+def stage_cost(stage):
+    """(cost, unit): seconds per megapixel where known, else per call."""
+
+    if stage["megapixels"]:
+        return stage["seconds"] / stage["megapixels"], "s/MP"
+    return stage["seconds"] / max(stage["calls"], 1), "s/call"
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+
+
+def compare_latest(entries, tool, window=5, threshold=10.0, min_seconds=0.05):
+    """
+    Compare tool's latest run with the median of up to window earlier
+    comparable runs. Returns (latest, baseline_runs, rows) with one row
+    per stage: (name, baseline, latest, unit, change_pct, slower).
+    Stages under min_seconds in the latest run are never flagged.
+    """
+
+    runs = [e for e in entries if e["tool"] == tool]
+    if not runs:
+        return None, [], []
+    latest = runs[-1]
+    baseline_runs = [e for e in runs[:-1] if comparable(e, latest)][-window:]
+
+    rows = []
+    for name, stage in latest["stages"].items():
+        if not stage["calls"]:
+            continue
+        cost, unit = stage_cost(stage)
+        history = [
+            stage_cost(e["stages"][name])[0] for e in baseline_runs
+            if e["stages"].get(name, {}).get("calls")
+        ]
+        if not history:
+            rows.append((name, None, cost, unit, None, False))
+            continue
+        base = median(history)
+        change = 100.0 * (cost - base) / base if base > 0 else 0.0
+        slower = change > threshold and stage["seconds"] >= min_seconds
+        rows.append((name, base, cost, unit, change, slower))
+    return latest, baseline_runs, rows
+
+
+def version_changes(old, new):
+    """'numpy 1.26.4 -> 2.1.0' for every library whose version differs."""
+
+    names = sorted(set(old) | set(new))
+    return [
+        f"{name} {old.get(name, '-')} -> {new.get(name, '-')}"
+        for name in names if old.get(name) != new.get(name)
+    ]
+
+
+def compare_command(args):
+    entries = load_history(args.history)
+    tools = [args.tool] if args.tool else sorted({e["tool"] for e in entries})
+    if not tools:
+        print(f"No runs recorded in {args.history} yet.")
+        return 0
+
+    flagged = 0
+    for tool in tools:
+        latest, baseline_runs, rows = compare_latest(
+            entries, tool, args.window, args.threshold, args.min_seconds
+        )
+        if latest is None:
+            print(f"{tool}: no runs recorded.")
+            continue
+        print(
+            f"{tool}: run of {latest['started']} ({latest['items']} item(s), "
+            f"{latest['megapixels']:.1f} MP, {latest['wall_seconds']:.1f} s) vs "
+            f"median of {len(baseline_runs)} earlier comparable run(s)"
+        )
+        if not baseline_runs:
+            print("  nothing to compare with yet (same machine and settings needed)")
+            continue
+        for name, base, cost, unit, change, slower in rows:
+            if base is None:
+                print(f"  {name:<12} {'-':>12} {cost:12.4f} {unit:<6}  new stage")
+                continue
+            mark = f"  SLOWER (> {args.threshold:g}%)" if slower else ""
+            print(f"  {name:<12} {base:12.4f} {cost:12.4f} {unit:<6} {change:+6.0f}%{mark}")
+            flagged += slower
+        changes = version_changes(baseline_runs[-1].get("versions", {}), latest.get("versions", {}))
+        if changes:
+            print("  library versions changed: " + ", ".join(changes))
+
+    if flagged:
+        print(f"\n{flagged} stage(s) slower than the baseline.")
+    return 1 if flagged else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Look at the run history of cube_to_equirect.py and make_pano_site.py."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    compare = commands.add_parser(
+        "compare",
+        help="Flag stages of the latest run that got slower than the rolling baseline.",
+        description=(
+            "Compare each tool's latest run with the median of its previous runs on "
+            "the same machine and settings. Stage times are taken per megapixel where "
+            "the stage records megapixels, else per call. Exits with 1 if a stage "
+            "is slower by more than --threshold."
+        ),
+    )
+    compare.add_argument(
+        "--history",
+        type=str,
+        default=history_path(),
+        help=f"History file. Default {history_path()}.",
+    )
+    compare.add_argument(
+        "--tool",
+        choices=("cube_to_equirect", "make_pano_site"),
+        default=None,
+        help="Only this tool. Default both.",
+    )
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Percent slower than the baseline that counts as a regression. Default 10.",
+    )
+    compare.add_argument(
+        "--window",
+        type=int,
+        default=5,
+        help="Number of earlier runs the baseline is the median of. Default 5.",
+    )
+    compare.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.05,
+        help="Ignore stages that took less than this in the latest run. Default 0.05.",
+    )
+    args = parser.parse_args()
+    sys.exit(compare_command(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the tools are plain scripts next to this folder, not an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
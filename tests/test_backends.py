@@ -0,0 +1,160 @@
+import cv2
+import numpy as np
+import py360convert
+import pytest
+from py360convert.utils import CubeFaceSampler
+
+import cube_backends as backends
+import cube_writer as writer
+
+FACE = 64
+WIDTH = 256
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    backends.drop_table_caches()
+    yield
+    backends.drop_table_caches()
+
+
+def noise_cube(face_w=FACE, dtype=np.uint8):
+    """Noise shows every seam and rounding difference."""
+    rng = np.random.default_rng(face_w)
+    return {k: rng.integers(0, 256, (face_w, face_w, 3)).astype(dtype) for k in backends.CUBE_FACE_ORDER}
+
+
+def test_pad_cube_faces_matches_py360convert():
+    cube = noise_cube(dtype=np.float32)
+    stack = np.stack([cube[k] for k in backends.CUBE_FACE_ORDER])
+    padded = backends.pad_cube_faces(cube)
+    for c in range(3):
+        # py360convert pads one channel at a time
+        np.testing.assert_array_equal(padded[..., c], CubeFaceSampler._pad(None, stack[..., c]))
+
+
+def gradient_cube(face_w=FACE):
+    """Smooth faces, each with its own level, so seams between faces stand out."""
+    x, y = np.meshgrid(*2 * [np.linspace(0, 255, face_w).astype(np.uint8)])
+    return {k: np.dstack([x, y, np.full_like(x, 40 * i)]) for i, k in enumerate(backends.CUBE_FACE_ORDER)}
+
+
+@pytest.mark.parametrize("cube", [noise_cube(), gradient_cube()], ids=["noise", "gradient"])
+def test_py360convert_backend_matches_c2e(cube):
+    expected = py360convert.c2e(cube, WIDTH // 2, WIDTH, cube_format="dict")
+    np.testing.assert_array_equal(backends.convert_cube_to_equirect(cube, WIDTH), expected)
+
+    # a band of the lookup is the same rows of the full one
+    face, u, v = backends.compute_equirect_lookup(FACE, WIDTH)
+    band = backends.compute_equirect_lookup(FACE, WIDTH, 37, 101)
+    for full, part in zip((face, u, v), band):
+        np.testing.assert_array_equal(part, full[37:101])
+
+
+BACKENDS = [b for b in backends.BACKENDS if b != "numba" or backends.njit is not None]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_matches_c2e(backend):
+    cube = noise_cube()
+    expected = py360convert.c2e(cube, WIDTH // 2, WIDTH, cube_format="dict")
+    np.testing.assert_array_equal(backends.convert_cube_to_equirect(cube, WIDTH, backend=backend), expected)
+
+
+def test_numpy_agrees_with_py360convert_backend():
+    cube = noise_cube()
+    expected = backends.convert_cube_to_equirect(cube, WIDTH, backend="py360convert")
+    equi = backends.convert_cube_to_equirect(cube, WIDTH, backend="numpy")
+    assert equi.dtype == np.uint8
+    np.testing.assert_array_equal(equi, expected)
+
+    # float faces take the float32 path, without the fixed-point rounding
+    floats = backends.convert_cube_to_equirect(
+        {k: v.astype(np.float32) for k, v in cube.items()}, WIDTH, backend="numpy"
+    )
+    assert np.abs(floats - expected).max() <= 0.5 + 1e-3
+
+
+def test_gather_plan_is_compact_and_cached(tmp_path):
+    idx, wx, wy = backends.get_gather_plan(FACE, WIDTH, str(tmp_path))
+    pixels = WIDTH * (WIDTH // 2)
+    assert idx.nbytes + wx.nbytes + wy.nbytes == 6 * pixels
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        f"plan_{FACE}_{WIDTH}_{name}.npy" for name in ("idx", "wx", "wy")
+    ]
+
+    # a new process maps the stored plan instead of building it
+    backends.drop_table_caches()
+    plan = backends.get_gather_plan(FACE, WIDTH, str(tmp_path))
+    assert isinstance(plan[0], np.memmap)
+    cube = noise_cube()
+    equi = np.empty((WIDTH // 2, WIDTH, 3), np.uint8)
+    backends.sample_cube_numpy(backends.pad_cube_faces(cube), plan, equi)
+    np.testing.assert_array_equal(equi, backends.convert_cube_to_equirect(cube, WIDTH, backend="numpy"))
+
+    backends.drop_table_caches()
+    assert not backends._plan_cache
+
+
+def read_banded(cube, backend, band_height, path):
+    writer.write_equirect_banded(cube, WIDTH, str(path), band_height, backend=backend)
+    return cv2.imread(str(path))
+
+
+def read_full(equi, path):
+    jpeg = writer.BandedJpegWriter(str(path), WIDTH, WIDTH // 2)
+    jpeg.write_band(equi)
+    jpeg.close()
+    return cv2.imread(str(path))
+
+
+def test_numpy_banded_matches_full_frame(tmp_path):
+    cube = noise_cube()
+    full = read_full(backends.convert_cube_to_equirect(cube, WIDTH, backend="numpy"), tmp_path / "full.jpg")
+    banded = read_banded(cube, "numpy", 16, tmp_path / "banded.jpg")
+    np.testing.assert_array_equal(banded, full)
+
+
+def test_remap_agrees_with_py360convert_backend(monkeypatch):
+    cube = noise_cube()
+    expected = backends.convert_cube_to_equirect(cube, WIDTH, backend="py360convert")
+    np.testing.assert_array_equal(backends.convert_cube_to_equirect(cube, WIDTH, backend="remap"), expected)
+
+    # faces spread over several atlases, as for very large faces
+    monkeypatch.setattr(backends, "REMAP_MAX_DIM", 2 * (FACE + 2 * backends.ATLAS_PAD))
+    assert len(backends.atlas_layout(FACE)[1]) == 2
+    backends.drop_table_caches()
+    np.testing.assert_array_equal(backends.convert_cube_to_equirect(cube, WIDTH, backend="remap"), expected)
+
+
+def test_remap_banded_matches_full_frame(tmp_path):
+    cube = noise_cube()
+    full = read_full(backends.convert_cube_to_equirect(cube, WIDTH, backend="remap"), tmp_path / "full.jpg")
+    banded = read_banded(cube, "remap", 16, tmp_path / "banded.jpg")
+    np.testing.assert_array_equal(banded, full)
+
+
+def test_band_sampler_agrees_with_py360convert_backend(tmp_path, monkeypatch):
+    # several map rows per face, the last one partly padding
+    monkeypatch.setattr(backends, "BAND_MAP_COLS", 1000)
+    cube = noise_cube()
+    expected = backends.convert_cube_to_equirect(cube, WIDTH, backend="py360convert")
+    equi = np.empty_like(expected)
+    lookup = backends.compute_equirect_lookup(FACE, WIDTH, 0, WIDTH // 2)
+    backends.sample_cube_band(backends.pad_cube_faces(cube), FACE, *lookup, equi)
+    np.testing.assert_array_equal(equi, expected)
+
+    full = read_full(expected, tmp_path / "full.jpg")
+    banded = read_banded(cube, "py360convert", 16, tmp_path / "banded.jpg")
+    np.testing.assert_array_equal(banded, full)
+
+
+@pytest.mark.skipif(backends.njit is None, reason="numba is not installed")
+def test_numba_agrees_with_py360convert_backend(tmp_path):
+    cube = noise_cube()
+    expected = backends.convert_cube_to_equirect(cube, WIDTH, backend="py360convert")
+    equi = backends.convert_cube_to_equirect(cube, WIDTH, backend="numba")
+    np.testing.assert_array_equal(equi, expected)
+
+    full = read_full(equi, tmp_path / "full.jpg")
+    np.testing.assert_array_equal(read_banded(cube, "numba", 16, tmp_path / "banded.jpg"), full)
@@ -0,0 +1,111 @@
+import argparse
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import cube_to_equirect as cte
+
+BASE = "Scene1"
+WIDTH = 256
+
+
+def make_faces(folder, face_w=64):
+    rng = np.random.default_rng(0)
+    faces = {}
+    for i in range(1, 7):
+        faces[i] = f"{BASE}_{i}.jpg"
+        cv2.imwrite(str(folder / faces[i]), rng.integers(0, 256, (face_w, face_w, 3)).astype(np.uint8))
+    return faces
+
+
+def make_args(**overrides):
+    args = dict(
+        width=WIDTH, max_width=cte.MAX_WIDTH, prefix="", interpolation="bilinear",
+        output="equirect", format="jpg", quality=90, progressive=False, subsampling="420",
+        target_size=None, backend="numpy", band_height=0, lut_cache=None,
+    )
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def convert(folder, faces, args, journal):
+    """process_base() on folder; returns (record, log lines)."""
+    lines = []
+    keep, record = cte.process_base(str(folder), BASE, faces, args, journal, log=lines.append)
+    assert record is not None, lines
+    assert keep == set(record[1]["outputs"])
+    return record, "\n".join(lines)
+
+
+def test_journal_skips_converted_bases(tmp_path):
+    faces = make_faces(tmp_path)
+    args = make_args()
+    (key, entry), log = convert(tmp_path, faces, args, {})
+    assert "Saved equirectangular panorama" in log
+    (out_name,) = entry["outputs"]
+    out_path = tmp_path / out_name
+    stamp = out_path.stat().st_mtime_ns
+
+    cte.save_journal(str(tmp_path), {key: entry})
+    journal = cte.load_journal(str(tmp_path))
+    assert journal == {key: entry}
+    record, log = convert(tmp_path, faces, args, journal)
+    assert record == (key, entry)
+    assert "Already converted" in log
+    assert out_path.stat().st_mtime_ns == stamp
+
+    # a damaged output is converted again
+    out_path.write_bytes(out_path.read_bytes()[:100])
+    record, log = convert(tmp_path, faces, args, journal)
+    assert record == (key, entry)
+    assert "Saved equirectangular panorama" in log
+
+
+@pytest.mark.parametrize("change", ["params", "faces"])
+def test_journal_reruns_on_changes(tmp_path, change):
+    faces = make_faces(tmp_path)
+    args = make_args()
+    key, entry = convert(tmp_path, faces, args, {})[0]
+
+    if change == "params":
+        args = make_args(quality=80)
+    else:
+        cv2.imwrite(str(tmp_path / faces[3]), np.zeros((64, 64, 3), np.uint8))
+    (new_key, new_entry), log = convert(tmp_path, faces, args, {key: entry})
+    assert new_key != key
+    assert "Saved equirectangular panorama" in log
+    assert new_key == cte.conversion_key(
+        str(tmp_path), BASE, cte.get_scene_title(str(tmp_path), BASE), faces,
+        cte.conversion_params(args, WIDTH),
+    )
+
+
+def test_journal_of_another_version_is_ignored(tmp_path):
+    cte.save_journal(str(tmp_path), {"k": {"outputs": {}}})
+    assert cte.load_journal(str(tmp_path)) == {"k": {"outputs": {}}}
+    with open(tmp_path / cte.JOURNAL_NAME, "w", encoding="utf-8") as f:
+        f.write('{"version": 0, "entries": {"k": {}}}')
+    assert cte.load_journal(str(tmp_path)) == {}
+
+
+def test_verify_image_and_commit_file(tmp_path):
+    tmp = tmp_path / ".pano.jpg.tmp"
+    final = tmp_path / "pano.jpg"
+    cv2.imwrite(str(tmp) + ".jpg", np.zeros((WIDTH // 2, WIDTH, 3), np.uint8))
+    os.replace(str(tmp) + ".jpg", tmp)
+
+    cte.verify_image(str(tmp), WIDTH, WIDTH // 2)
+    with pytest.raises(RuntimeError, match="wrong size"):
+        cte.verify_image(str(tmp), 2 * WIDTH, WIDTH)
+
+    final.write_bytes(b"old")
+    cte.commit_file(str(tmp), str(final))
+    assert not tmp.exists()
+    cte.verify_image(str(final), WIDTH, WIDTH // 2)
+
+    # a cut-off file does not decode
+    final.write_bytes(final.read_bytes()[:50])
+    with pytest.raises(RuntimeError, match="does not decode"):
+        cte.verify_image(str(final), WIDTH, WIDTH // 2)
@@ -0,0 +1,150 @@
+import os
+
+import cv2
+import numpy as np
+
+import make_pano_site as site
+import pano_metrics
+
+
+def make_images(folder, names):
+    folder.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        (folder / name).write_bytes(name.encode("utf-8"))
+
+
+def test_project_build_keeps_root_gallery(tmp_path):
+    src = tmp_path / "src"
+    projects = tmp_path / "projects"
+    out = tmp_path / "docs"
+    make_images(src, ["Scene 0.jpg", "Scene 1.jpg", "plan.png"])
+    make_images(projects / "andrius", ["a.jpg"])
+    make_images(projects / "kolektyvo", ["k.jpg"])
+
+    site.build_gallery(src, out, tier_widths=(), index_name=site.ROOT_INDEX_NAME)
+    root_files = [
+        "Scene 0.jpg", "Scene 1.jpg", "plan.png", "view_Scene_0.html", "view_Scene_1.html",
+        site.ROOT_INDEX_NAME,
+    ]
+    site.build_projects(projects, out, workers=2, tier_widths=())
+
+    for name in root_files:
+        assert (out / name).is_file(), name
+    assert (out / "andrius" / "view_a.html").is_file()
+    assert (out / "kolektyvo" / "view_k.html").is_file()
+
+    # and the other way round: a root rebuild leaves the projects alone
+    sync = site.build_gallery(src, out, tier_widths=(), index_name=site.ROOT_INDEX_NAME)
+    assert sync.removed == 0
+    assert (out / "andrius" / "index.html").is_file()
+    index = site.OutputSync(out, manifest_name=site.PROJECTS_MANIFEST_NAME)
+    assert set(index.old) == {"index.html"}
+
+
+def test_root_gallery_leaves_the_project_index(tmp_path):
+    src = tmp_path / "src"
+    projects = tmp_path / "projects"
+    out = tmp_path / "docs"
+    make_images(src, ["Scene 0.jpg"])
+    make_images(projects / "andrius", ["a.jpg"])
+
+    def root():
+        return site.build_gallery(src, out, tier_widths=(), index_name=site.ROOT_INDEX_NAME)
+
+    # an index.html from elsewhere (e.g. committed) survives a root build
+    out.mkdir()
+    (out / "index.html").write_text("committed", encoding="utf-8")
+    root()
+    assert (out / "index.html").read_text(encoding="utf-8") == "committed"
+
+    site.build_projects(projects, out, workers=1, tier_widths=())
+    project_index = (out / "index.html").read_text(encoding="utf-8")
+    assert "Panorama projektai" in project_index
+    assert 'href="andrius/index.html"' in project_index
+
+    root()
+    assert (out / "index.html").read_text(encoding="utf-8") == project_index
+    assert "view_Scene_0.html" in (out / site.ROOT_INDEX_NAME).read_text(encoding="utf-8")
+    viewer = (out / "view_Scene_0.html").read_text(encoding="utf-8")
+    assert f'href="{site.ROOT_INDEX_NAME}">Back' in viewer
+
+    # a root gallery built before this change listed index.html in its manifest
+    manifest = site.load_manifest(out)
+    manifest["index.html"] = {"src": None, "size": 0, "hash": ""}
+    site.save_manifest(out, manifest)
+    assert root().removed == 0
+    assert (out / "index.html").read_text(encoding="utf-8") == project_index
+
+    site.build_projects(projects, out, workers=1, tier_widths=())
+    assert (out / "index.html").read_text(encoding="utf-8") == project_index
+    assert (out / "andrius" / "index.html").is_file()
+
+
+def make_panoramas(folder, names):
+    folder.mkdir(parents=True, exist_ok=True)
+    for i, name in enumerate(names):
+        cv2.imwrite(str(folder / name), np.full((32, 64, 3), 40 * i, np.uint8))
+
+
+def test_rebuild_writes_only_changes(tmp_path):
+    src = tmp_path / "src"
+    out = tmp_path / "docs"
+    make_panoramas(src, ["A.jpg", "B.jpg"])
+
+    first = site.build_gallery(src, out, tier_widths=(32,))
+    assert first.written > 0 and first.removed == 0
+    files = sorted(p.relative_to(out).as_posix() for p in out.rglob("*") if p.is_file())
+    assert set(site.load_manifest(out)) == set(files) - {site.MANIFEST_NAME}
+    stamps = {rel: (out / rel).stat().st_mtime_ns for rel in files if rel != site.MANIFEST_NAME}
+
+    # nothing changed, or only the mtime of a source: nothing is written
+    for touch in (False, True):
+        if touch:
+            os.utime(src / "A.jpg", ns=(1_000_000_000, 1_000_000_000))
+        sync = site.build_gallery(src, out, tier_widths=(32,))
+        assert (sync.written, sync.removed) == (0, 0)
+        assert sync.unchanged == len(stamps)
+        assert {rel: (out / rel).stat().st_mtime_ns for rel in stamps} == stamps
+
+    # a deleted source takes its copy, viewer page and derivatives along
+    (src / "B.jpg").unlink()
+    sync = site.build_gallery(src, out, tier_widths=(32,))
+    gone = ["B.jpg", "view_B.html", f"{site.TIERS_DIR}/B_32.jpg", f"{site.TIERS_DIR}/B_preview.jpg"]
+    assert sync.removed == len(gone)
+    for rel in gone:
+        assert not (out / rel).exists(), rel
+        assert rel not in site.load_manifest(out)
+    assert (out / "view_A.html").is_file()
+    assert (out / site.TIERS_DIR / "A_32.jpg").is_file()
+
+
+def test_derivative_stages_are_keyed_by_image(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    for name in ("A", "B"):
+        cv2.imwrite(str(src / f"{name}.jpg"), np.full((32, 64, 3), 100, np.uint8))
+    metrics = pano_metrics.RunMetrics("make_pano_site")
+    with metrics.stage("(run)", "total"):
+        site.build_gallery(src, tmp_path / "docs", tier_widths=(32,), metrics=metrics)
+
+    assert set(metrics.items) == {"(run)", "docs", "docs/A", "docs/B"}
+    assert set(metrics.items["docs"]) == {"scan", "render"}
+    assert set(metrics.items["docs/A"]) == {"copy", "decode", "downscale", "encode"}
+    assert "make_pano_site: 3 item(s)" in metrics.summary()
+
+
+def test_find_projects_order_ignores_mtimes(tmp_path, monkeypatch):
+    monkeypatch.setattr(site, "PROJECT_ORDER", ("robandgab", "kolektyvo", "andrius"))
+    for name in ("andrius", "zeta", "kolektyvo", "beta", "robandgab"):
+        make_images(tmp_path / name, ["x.jpg"])
+    (tmp_path / "empty").mkdir()
+    (tmp_path / ".hidden").mkdir()
+    make_images(tmp_path / ".hidden", ["x.jpg"])
+
+    expected = ["robandgab", "kolektyvo", "andrius", "beta", "zeta"]
+    for stamp in (1_000_000, 2_000_000):
+        # a checkout gives every folder the same mtime; touching one must not reorder
+        for p in tmp_path.iterdir():
+            os.utime(p, (stamp, stamp))
+        os.utime(tmp_path / "andrius", (stamp + 10, stamp + 10))
+        assert [p.name for p in site.find_projects(tmp_path)] == expected
@@ -0,0 +1,127 @@
+import argparse
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pano_metrics
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+def test_profiled_covers_worker_threads(tmp_path):
+    done = []
+
+    def run():
+        with pano_metrics.profiled("test", tmp_path):
+            with ThreadPoolExecutor(2) as pool:
+                done.extend(pool.map(busy, [20000] * 4))
+
+    # a profiler clash used to leave the pool hanging, not raising
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive()
+    assert len(done) == 4
+    (out_dir,) = tmp_path.iterdir()
+    assert "(busy)" in (out_dir / "profile.txt").read_text(encoding="utf-8")
+
+
+def bucket_counts(prom, stage):
+    counts = {}
+    for line in prom.render().splitlines():
+        if line.startswith(f'test_stage_duration_seconds_bucket{{stage="{stage}"'):
+            key, value = line.rsplit(" ", 1)
+            counts[key] = int(value)
+    return counts
+
+
+def test_prom_histogram_counts_each_finished_stage(tmp_path):
+    metrics = pano_metrics.RunMetrics("test")
+    prom = pano_metrics.PromTextfile(tmp_path, metrics)
+
+    # one item, two calls: two observations, not one of their sum
+    metrics.add("a", "encode", 0.08)
+    metrics.add("a", "encode", 0.08)
+    first = bucket_counts(prom, "encode")
+    assert first['test_stage_duration_seconds_bucket{stage="encode",le="0.1"}'] == 2
+
+    worker = pano_metrics.RunMetrics("test")
+    worker.add("b", "encode", 3.0)
+    metrics.merge(worker.export())
+    metrics.add("a", "encode", 0.08)
+    second = bucket_counts(prom, "encode")
+    assert all(second[key] >= value for key, value in first.items())
+    assert second['test_stage_duration_seconds_bucket{stage="encode",le="0.1"}'] == 3
+    assert second['test_stage_duration_seconds_bucket{stage="encode",le="+Inf"}'] == 4
+    assert 'test_stage_duration_seconds_count{stage="encode"} 4' in prom.render()
+
+
+def record_run(path, seconds, **stages):
+    """Append a cube_to_equirect run with a 10 MP convert stage to the history."""
+    metrics = pano_metrics.RunMetrics("cube_to_equirect")
+    metrics.add("Scene1", "convert", seconds, megapixels=10.0)
+    for name, stage_seconds in stages.items():
+        metrics.add("Scene1", name, stage_seconds)
+    assert metrics.append_history(str(path))
+
+
+def compare(path, capsys, **overrides):
+    options = dict(history=str(path), tool=None, window=5, threshold=10.0, min_seconds=0.05)
+    options.update(overrides)
+    status = pano_metrics.compare_command(argparse.Namespace(**options))
+    return status, capsys.readouterr().out
+
+
+def test_compare_flags_slower_stages(tmp_path, capsys):
+    path = tmp_path / "history.jsonl"
+    status, out = compare(path, capsys)
+    assert (status, out.strip()) == (0, f"No runs recorded in {path} yet.")
+
+    record_run(path, 1.0)
+    status, out = compare(path, capsys)
+    assert status == 0
+    assert "vs median of 0 earlier comparable run(s)" in out
+    assert "nothing to compare with yet" in out
+
+    for seconds in (1.0, 3.0, 1.2):
+        record_run(path, seconds)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("not json\n")
+    record_run(path, 1.05, upload=0.5)
+    status, out = compare(path, capsys)
+    assert status == 0
+    assert "vs median of 4 earlier comparable run(s)" in out
+    convert_line, upload_line = [line.split() for line in out.splitlines()[1:3]]
+    # the baseline is the median, 0.11 s/MP; one slow run does not move it
+    assert convert_line == ["convert", "0.1100", "0.1050", "s/MP", "-5%"]
+    assert upload_line == ["upload", "-", "0.5000", "s/call", "new", "stage"]
+
+    record_run(path, 2.2)
+    status, out = compare(path, capsys)
+    assert status == 1
+    assert "0.1050       0.2200 s/MP     +110%  SLOWER (> 10%)" in out
+    assert out.rstrip().endswith("1 stage(s) slower than the baseline.")
+
+    # a higher threshold clears it; window limits the baseline to the last runs
+    assert compare(path, capsys, threshold=150.0)[0] == 0
+    assert "convert            0.1125" in compare(path, capsys, window=2)[1]
+
+
+def test_compare_needs_the_same_machine_and_settings(tmp_path, capsys):
+    path = tmp_path / "history.jsonl"
+    record_run(path, 1.0)
+    record_run(path, 1.0)
+    entries = pano_metrics.load_history(str(path))
+    entries[0]["machine"] = dict(entries[0]["machine"], cpu_count=-1)
+    entries[1]["versions"] = dict(entries[1]["versions"], numpy="0.1")
+    record_run(path, 1.0)
+    entries.append(pano_metrics.load_history(str(path))[-1])
+    entries[-1]["versions"] = dict(entries[-1]["versions"], numpy="0.2")
+    path.write_text("".join(json.dumps(e) + "\n" for e in entries), encoding="utf-8")
+
+    status, out = compare(path, capsys, tool="cube_to_equirect")
+    assert status == 0
+    assert "vs median of 1 earlier comparable run(s)" in out
+    assert "library versions changed: numpy 0.1 -> 0.2" in out
@@ -0,0 +1,70 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+import cube_backends as backends
+import cube_scheduler as scheduler
+from cube_faces import find_cube_sets
+
+SCRIPT = Path(__file__).resolve().parent.parent / "cube_to_equirect.py"
+FACE = 512
+WIDTH = 2048
+
+
+def make_cube_set(folder, base="Scene", face_w=FACE):
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(face_w)
+    face = cv2.GaussianBlur(rng.integers(0, 256, (face_w, face_w, 3), dtype=np.uint8), (0, 0), 3)
+    for i in range(1, 7):
+        cv2.imwrite(str(folder / f"{base}{i}.jpg"), face)
+
+
+def plan_args(backend="numpy", band_height=0):
+    return argparse.Namespace(
+        backend=backend, band_height=band_height, output="equirect", format="jpg",
+        progressive=False, target_size=None, width=WIDTH, max_width=None, jobs=4,
+    )
+
+
+def test_plan_bands_a_base_too_large_alone(tmp_path, capsys):
+    make_cube_set(tmp_path, "Big")
+    args = plan_args()
+    full = scheduler.estimate_base_memory(FACE, WIDTH, args)
+    banded = scheduler.estimate_base_memory(FACE, WIDTH, args, 64)
+    budget = 2 * scheduler.PROCESS_MEMORY + (full + banded) // 2
+
+    planned = scheduler.plan_memory(str(tmp_path), find_cube_sets(str(tmp_path)), args, budget)
+    ((base, _, estimate, band_height, tables),) = planned
+    assert args.jobs == 1
+    assert band_height in scheduler.BAND_HEIGHTS
+    assert estimate <= budget - 2 * scheduler.PROCESS_MEMORY
+    assert tables == (FACE, WIDTH)
+    assert "converting in bands" in capsys.readouterr().out
+
+
+BACKENDS = [b for b in backends.BACKENDS if b != "numba" or backends.njit is not None]
+
+
+@pytest.mark.parametrize("backend, band_height", [(b, 0) for b in BACKENDS] + [("numpy", 64)])
+def test_worker_peak_stays_within_estimate(tmp_path, backend, band_height):
+    make_cube_set(tmp_path)
+    report = tmp_path / "report.json"
+    cmd = [
+        sys.executable, str(SCRIPT), "--indir", str(tmp_path), "--width", str(WIDTH),
+        "--backend", backend, "--jobs", "1", "--threads", "1", "--max-memory", "4G",
+        "--history", "", "--report", str(report),
+    ]
+    if band_height:
+        cmd += ["--band-height", str(band_height)]
+    subprocess.run(cmd, check=True, capture_output=True)
+
+    stages = json.loads(report.read_text(encoding="utf-8"))["items"]["Scene"]
+    peak = max(s["peak_rss_mb"] for s in stages.values()) * 2**20
+    estimate = scheduler.estimate_base_memory(FACE, WIDTH, plan_args(backend, band_height), band_height)
+    assert peak <= scheduler.PROCESS_MEMORY + estimate
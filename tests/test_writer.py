@@ -0,0 +1,35 @@
+import numpy as np
+
+import cube_writer as writer
+
+
+def noise_image():
+    return np.random.default_rng(0).integers(0, 256, (128, 256, 3)).astype(np.uint8)
+
+
+def test_encode_to_target_picks_the_highest_quality_that_fits():
+    img = noise_image()
+    target = len(writer.encode_image(img, "jpg", 70))
+    data, quality = writer.encode_to_target(img, "jpg", target, 95)
+    assert quality >= 70
+    assert len(data) <= target
+    assert len(writer.encode_image(img, "jpg", quality + 1)) > target
+    assert data == writer.encode_image(img, "jpg", quality)
+
+
+def test_encode_to_target_falls_back_to_the_lowest_quality():
+    img = noise_image()
+    data, quality = writer.encode_to_target(img, "jpg", 100, 95)
+    assert quality == writer.MIN_TARGET_QUALITY
+    assert data == writer.encode_image(img, "jpg", writer.MIN_TARGET_QUALITY)
+
+
+def test_encode_to_target_below_the_minimum_quality():
+    img = noise_image()
+    max_quality = writer.MIN_TARGET_QUALITY - 10
+    data, quality = writer.encode_to_target(img, "jpg", 100000, max_quality)
+    assert (data, quality) == (writer.encode_image(img, "jpg", max_quality), max_quality)
+
+    # too big even then: still max_quality, never above it
+    data, quality = writer.encode_to_target(img, "jpg", 100, max_quality)
+    assert (data, quality) == (writer.encode_image(img, "jpg", max_quality), max_quality)